@@ -15,6 +15,19 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import logging
 import traceback
+import threading
+import time
+import schedule
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import has_app_context
+from mysql.connector import pooling
+from etl.fingerprint import item_fingerprint, movement_hashes
+from etl.mysql_bulk import shadow_swap_load, bulk_insert, LOAD_METHODS
+from etl.availability import (refresh_availability, refresh_reserved, add_reservation,
+                               add_reservations, get_availability, item_key)
+from etl import tally_fixture
 
 # ---------------------------
 # Configuration & setup
@@ -25,16 +38,111 @@ app.secret_key = os.getenv("APP_SECRET", "supersecret")
 CORS(app)
 
 # ---------------------------
-# DB Connection
+# DB Connection (pooled, one connection per request)
 # ---------------------------
+MYSQL_CONFIG = {
+    "host": os.getenv("MYSQL_HOST", "localhost"),
+    "user": os.getenv("MYSQL_USER", "root"),
+    "password": os.getenv("MYSQL_PASSWORD", ""),
+    "database": os.getenv("MYSQL_DB", "inventory_db"),
+    "port": int(os.getenv("MYSQL_PORT", 3306)),
+}
+# How sync_from_tally loads movements: "executemany" or "infile" (LOAD DATA
+# LOCAL INFILE, falls back to executemany if the server refuses it). Local
+# infile is only enabled on the pool when asked for.
+TALLY_LOAD_METHOD = os.getenv("TALLY_LOAD_METHOD", "executemany")
+if TALLY_LOAD_METHOD == "infile":
+    MYSQL_CONFIG["allow_local_infile"] = True
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 5))
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", 10))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name="inventory_app",
+                    pool_size=MYSQL_POOL_SIZE,
+                    pool_reset_session=True,
+                    **MYSQL_CONFIG
+                )
+    return _pool
+
+def _checkout_connection():
+    """
+    Take a connection from the pool, waiting up to MYSQL_POOL_TIMEOUT seconds
+    when it is exhausted. The connection is pinged (and reconnected if the
+    server dropped it) before it is handed out.
+    """
+    deadline = time.monotonic() + MYSQL_POOL_TIMEOUT
+    while True:
+        try:
+            conn = _get_pool().get_connection()
+        except mysql.connector.errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+            continue
+        try:
+            conn.ping(reconnect=True, attempts=2, delay=0)
+            return conn
+        except mysql.connector.Error:
+            logging.warning("Discarding dead pooled MySQL connection")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            if time.monotonic() >= deadline:
+                raise
+
+class _RequestConnection:
+    """
+    Wrapper around the connection bound to the current request.
+    close() only ends the current unit of work (uncommitted changes are rolled
+    back, exactly as a real close would); the connection itself goes back to
+    the pool in the teardown hook.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        try:
+            self._conn.rollback()
+        except Exception:
+            pass
+
 def get_connection():
-    return mysql.connector.connect(
-        host=os.getenv("MYSQL_HOST", "localhost"),
-        user=os.getenv("MYSQL_USER", "root"),
-        password=os.getenv("MYSQL_PASSWORD", ""),
-        database=os.getenv("MYSQL_DB", "inventory_db"),
-        port=int(os.getenv("MYSQL_PORT", 3306))
-    )
+    """
+    Inside a request: the connection bound to `g` (checked out on first use).
+    Outside a request (sync jobs, scripts): a pooled connection owned by the
+    caller, which must close() it to return it to the pool.
+    """
+    if has_app_context():
+        if "db" not in g:
+            g.db = _checkout_connection()
+        return _RequestConnection(g.db)
+    return _checkout_connection()
+
+@app.teardown_appcontext
+def _release_connection(exc):
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+    try:
+        conn.close()
+    except Exception:
+        logging.exception("Failed to return MySQL connection to pool")
 
 # ---------------------------
 # Constants
@@ -58,6 +166,19 @@ JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", 60*24))
 
 TALLY_URL = os.getenv("TALLY_GATEWAY_URL", "")
 TALLY_API_KEY = os.getenv("TALLY_API_KEY", "")
+TALLY_CONNECT_TIMEOUT = float(os.getenv("TALLY_CONNECT_TIMEOUT", 5))
+# read timeouts per gateway endpoint (seconds)
+TALLY_READ_TIMEOUTS = {
+    "stock_items": float(os.getenv("TALLY_TIMEOUT_STOCK_ITEMS", 30)),
+    "stock_movements": float(os.getenv("TALLY_TIMEOUT_STOCK_MOVEMENTS", 120)),
+}
+TALLY_RETRIES = int(os.getenv("TALLY_RETRIES", 3))
+TALLY_BACKOFF = float(os.getenv("TALLY_BACKOFF", 0.5))
+# TALLY_FIXTURE: serve gateway responses from a recorded/synthetic fixture
+# (etl/tally_fixture.py) instead of TALLY_GATEWAY_URL; TALLY_RECORD: save the
+# responses of each sync to that fixture file
+TALLY_FIXTURE = os.getenv("TALLY_FIXTURE", "")
+TALLY_RECORD = os.getenv("TALLY_RECORD", "")
 
 # ---------------------------
 # Utilities
@@ -259,6 +380,8 @@ def simple_release_reservation(item_name: str, billed_qty: float, voucher_no: st
         conn = get_connection()
         conn.start_transaction()
         cur = conn.cursor()
+        # lock the availability row first (lock order: etl/availability.py)
+        get_availability(cur, [item_name], lock=True)
 
         # 1) exact-match attempt
         cur.execute("""
@@ -273,6 +396,7 @@ def simple_release_reservation(item_name: str, billed_qty: float, voucher_no: st
         if row:
             rid = row[0]
             cur.execute("DELETE FROM stock_reservations WHERE id=%s", (rid,))
+            refresh_reserved(cur, [item_name])
             conn.commit()
             cur.close()
             return {"ok": True, "mode": "exact", "consumed_reservation_id": rid, "fulfilled": billed_qty}
@@ -296,11 +420,13 @@ def simple_release_reservation(item_name: str, billed_qty: float, voucher_no: st
         if new_qty <= 0:
             # remove reservation
             cur.execute("DELETE FROM stock_reservations WHERE id=%s", (rid,))
+            refresh_reserved(cur, [item_name])
             conn.commit()
             cur.close()
             return {"ok": True, "mode": "fallback_remove", "consumed_reservation_id": rid, "fulfilled": min(rqty, billed_qty)}
         else:
             cur.execute("UPDATE stock_reservations SET qty=%s WHERE id=%s", (new_qty, rid))
+            refresh_reserved(cur, [item_name])
             conn.commit()
             cur.close()
             return {"ok": True, "mode": "fallback_reduce", "reservation_id": rid, "was": rqty, "now": new_qty, "fulfilled": billed_qty}
@@ -321,78 +447,434 @@ def simple_release_reservation(item_name: str, billed_qty: float, voucher_no: st
             pass
 
 # ---------------------------
-# Sync from Tally (keeps your bulk insert behaviour)
-# integrated to call simple_release_reservation for OUT movements
+# Batch reservation release (used after Tally sync)
 # ---------------------------
-def sync_from_tally():
-    headers = {"X-API-KEY": TALLY_API_KEY} if TALLY_API_KEY else {}
-    try:
-        items = requests.get(f"{TALLY_URL.rstrip('/')}/stock_items", headers=headers, timeout=15).json()
-        moves = requests.get(f"{TALLY_URL.rstrip('/')}/stock_movements", headers=headers, timeout=15).json()
-    except Exception as e:
-        logging.exception("Tally fetch failed: %s", e)
-        return {"ok": False, "error": f"Tally fetch failed: {e}"}
+# max ids per IN (...) list in set-based statements
+SQL_CHUNK_SIZE = int(os.getenv("SQL_CHUNK_SIZE", 500))
 
+def _chunks(seq, size):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+def batch_release_reservations(moves):
+    """
+    Set-based equivalent of calling simple_release_reservation() for every OUT
+    movement in `moves`, in order.
+    - OUT quantities are grouped per item in memory.
+    - All ACTIVE reservations of the affected items are locked with one
+      SELECT ... FOR UPDATE per chunk of items, and the exact-match-first /
+      oldest-first rules are replayed in Python.
+    - The outcome is written back with one DELETE and one UPDATE per chunk,
+      and stock_availability is refreshed for the affected items, all inside
+      a single transaction.
+    Items are matched like MySQL compares names (case and accent insensitive).
+    Returns {"ok": True, "items": {item: summary}} keyed by the stored item
+    name, where summary holds billed, fulfilled, exact, removed and reduced
+    counts.
+    """
+    # grouped by item_key(), like MySQL compares item names; `names` holds the
+    # stored name once the availability rows are read
+    billed, names = {}, {}
+    for m in moves or []:
+        if (m.get("movement_type") or "").upper() != "OUT":
+            continue
+        item = m.get("item")
+        try:
+            qty = float(m.get("qty") or 0)
+        except (TypeError, ValueError):
+            continue
+        if item and qty > 0:
+            key = item_key(item)
+            names.setdefault(key, item)
+            billed.setdefault(key, []).append(qty)
+    if not billed:
+        return {"ok": True, "items": {}, "msg": "nothing to do"}
+
+    conn = None
     try:
         conn = get_connection()
+        conn.start_transaction()
         cur = conn.cursor()
 
-        # existing behaviour: clear and insert fresh
-        cur.execute("TRUNCATE TABLE stock_items")
-        cur.execute("TRUNCATE TABLE stock_movements")
-
-        item_data = []
-        for i in items or []:
-            item_data.append((
-                i.get("name"),
-                i.get("category"),
-                i.get("base_unit"),
-                i.get("closing_qty", 0),
-                i.get("closing_rate", 0)
-            ))
-        if item_data:
-            cur.executemany("""
-                INSERT INTO stock_items (name, category, base_unit, opening_qty, opening_rate)
-                VALUES (%s, %s, %s, %s, %s)
-            """, item_data)
-
-        move_data = []
-        for m in moves or []:
-            move_data.append((
-                m.get("date"),
-                m.get("voucher_no"),
-                m.get("company"),
-                m.get("item"),
-                m.get("qty", 0),
-                m.get("rate", 0),
-                m.get("amount", 0),
-                m.get("movement_type")
-            ))
-        if move_data:
-            cur.executemany("""
-                INSERT INTO stock_movements (date, voucher_no, company, item, qty, rate, amount, movement_type)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, move_data)
-
+        # lock the availability rows first (in item order), then the
+        # reservations: the same order as the reservation endpoints, so a
+        # release racing a reservation waits instead of deadlocking
+        for name in get_availability(cur, names.values(), lock=True):
+            names[item_key(name)] = name
+        reservations = {}
+        for chunk in _chunks(sorted(names.values()), SQL_CHUNK_SIZE):
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(f"""
+                SELECT id, item, qty FROM stock_reservations
+                WHERE item IN ({placeholders}) AND status='ACTIVE'
+                  AND (end_date IS NULL OR end_date >= CURDATE())
+                ORDER BY item, start_date ASC, id ASC
+                FOR UPDATE
+            """, tuple(chunk))
+            for rid, item, rqty in cur.fetchall():
+                # [id, original qty, current qty], kept in oldest-first order
+                q = float(rqty or 0.0)
+                reservations.setdefault(item_key(item), []).append([rid, q, q])
+
+        deleted, updated = [], {}
+        summary = {}
+        for key, qtys in billed.items():
+            open_res = reservations.get(key, [])
+            s = {"billed": 0.0, "fulfilled": 0.0, "exact": 0, "removed": 0, "reduced": 0, "consumed_reservation_ids": []}
+            for qty in qtys:
+                s["billed"] += qty
+                if not open_res:
+                    continue
+                # 1) exact match on the oldest reservation with qty == billed qty
+                match = next((r for r in open_res if r[2] == qty), None)
+                if match is not None:
+                    open_res.remove(match)
+                    deleted.append(match[0])
+                    updated.pop(match[0], None)
+                    s["exact"] += 1
+                    s["fulfilled"] += qty
+                    s["consumed_reservation_ids"].append(match[0])
+                    continue
+                # 2) fallback: reduce the oldest reservation
+                oldest = open_res[0]
+                new_qty = round(oldest[2] - qty, 2)
+                if new_qty <= 0:
+                    open_res.pop(0)
+                    deleted.append(oldest[0])
+                    updated.pop(oldest[0], None)
+                    s["removed"] += 1
+                    s["fulfilled"] += min(oldest[2], qty)
+                    s["consumed_reservation_ids"].append(oldest[0])
+                else:
+                    oldest[2] = new_qty
+                    updated[oldest[0]] = new_qty
+                    s["reduced"] += 1
+                    s["fulfilled"] += qty
+            summary[names[key]] = s
+
+        for chunk in _chunks(deleted, SQL_CHUNK_SIZE):
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(f"DELETE FROM stock_reservations WHERE id IN ({placeholders})", tuple(chunk))
+
+        for chunk in _chunks(sorted(updated.items()), SQL_CHUNK_SIZE):
+            cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+            placeholders = ",".join(["%s"] * len(chunk))
+            params = [v for pair in chunk for v in pair] + [rid for rid, _ in chunk]
+            cur.execute(f"UPDATE stock_reservations SET qty = CASE id {cases} END WHERE id IN ({placeholders})", tuple(params))
+
+        refresh_reserved(cur, [item for item, s in summary.items() if s["exact"] or s["removed"] or s["reduced"]])
         conn.commit()
         cur.close()
-        conn.close()
+        return {"ok": True, "items": summary, "deleted": len(deleted), "updated": len(updated)}
+    except Exception as e:
+        try:
+            if conn:
+                conn.rollback()
+        except:
+            pass
+        logging.exception("batch_release_reservations error: %s", e)
+        return {"ok": False, "error": str(e)}
+    finally:
+        try:
+            if conn:
+                conn.close()
+        except:
+            pass
 
-        # After bulk-insert, attempt reservation release per OUT movement (best-effort, opens own tx per call)
-        for m in moves or []:
-            try:
-                if (m.get("movement_type") or "").upper() == "OUT":
-                    itm = m.get("item")
-                    qty = float(m.get("qty") or 0)
-                    vno = m.get("voucher_no")
-                    simple_release_reservation(itm, qty, voucher_no=vno, movement_id=None)
-            except Exception:
-                logging.exception("release per-move error for movement: %s", m)
+# ---------------------------
+# Sync from Tally
+# - "incremental" (default): diff incoming rows against MySQL by content hash and
+#   only insert/update/delete what changed
+# - "swap": full reload into shadow tables published with one atomic RENAME TABLE
+# - "full": the original clear-and-reinsert behaviour
+# Reservations are released in one batch for OUT movements that were loaded.
+# ---------------------------
+TALLY_SYNC_MODE = os.getenv("TALLY_SYNC_MODE", "incremental")
+
+_tally_http = None
+_tally_http_lock = threading.Lock()
+
+def _get_tally_http():
+    """Shared keep-alive session for the Tally gateway, with retry/backoff on transient errors."""
+    global _tally_http
+    if _tally_http is None:
+        with _tally_http_lock:
+            if _tally_http is None:
+                s = requests.Session()
+                retry = Retry(
+                    total=TALLY_RETRIES,
+                    backoff_factor=TALLY_BACKOFF,
+                    status_forcelist=(429, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                )
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=retry)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                s.headers["Accept-Encoding"] = "gzip, deflate"
+                if TALLY_API_KEY:
+                    s.headers["X-API-KEY"] = TALLY_API_KEY
+                _tally_http = s
+    return _tally_http
+
+def _fetch_tally_fixture(endpoint):
+    t0 = time.monotonic()
+    data = list(tally_fixture.iter_gateway(TALLY_FIXTURE, endpoint))
+    stats = {
+        "seconds": round(time.monotonic() - t0, 3),
+        "bytes": None,
+        "encoding": "fixture",
+        "rows": len(data),
+    }
+    return data, stats
+
+def _fetch_tally(endpoint):
+    if TALLY_FIXTURE:
+        return _fetch_tally_fixture(endpoint)
+    t0 = time.monotonic()
+    resp = _get_tally_http().get(
+        f"{TALLY_URL.rstrip('/')}/{endpoint}",
+        timeout=(TALLY_CONNECT_TIMEOUT, TALLY_READ_TIMEOUTS.get(endpoint, 60)),
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    stats = {
+        "seconds": round(time.monotonic() - t0, 3),
+        "bytes": int(resp.headers.get("Content-Length") or len(resp.content)),
+        "encoding": resp.headers.get("Content-Encoding", "identity"),
+        "rows": len(data) if isinstance(data, list) else None,
+    }
+    return data, stats
+
+def fetch_tally_datasets(endpoints):
+    """Fetch several gateway endpoints in parallel. Returns {endpoint: (data, stats)}."""
+    with ThreadPoolExecutor(max_workers=len(endpoints)) as ex:
+        futures = {ep: ex.submit(_fetch_tally, ep) for ep in endpoints}
+        return {ep: f.result() for ep, f in futures.items()}
+
+MOVEMENT_LOAD_COLUMNS = ("date", "voucher_no", "company", "item", "qty", "rate", "amount",
+                         "movement_type", "movement_hash")
+
+def _sync_full(cur, item_data, move_data, move_hashes, load_method):
+    cur.execute("TRUNCATE TABLE stock_items")
+    cur.execute("TRUNCATE TABLE stock_movements")
+    if item_data:
+        cur.executemany("""
+            INSERT INTO stock_items (name, category, base_unit, opening_qty, opening_rate)
+            VALUES (%s, %s, %s, %s, %s)
+        """, item_data)
+    bulk_insert(cur, "stock_movements", MOVEMENT_LOAD_COLUMNS,
+                [m + (h,) for m, h in zip(move_data, move_hashes)], method=load_method)
+    refresh_availability(cur)
+    return {
+        "items": {"inserted": len(item_data), "updated": 0, "deleted": 0},
+        "movements": {"inserted": len(move_data), "updated": 0, "deleted": 0},
+    }, list(range(len(move_data)))
+
+def _sync_swap(conn, item_data, move_data, move_hashes, load_method):
+    # the unique name index is rebuilt after the load, so drop duplicate names up front
+    items_by_name = {row[0]: row for row in item_data if row[0]}
+    loaded = shadow_swap_load(conn, [
+        ("stock_items", ("name", "category", "base_unit", "opening_qty", "opening_rate"),
+         list(items_by_name.values())),
+        ("stock_movements", MOVEMENT_LOAD_COLUMNS,
+         [m + (h,) for m, h in zip(move_data, move_hashes)]),
+    ], loader=lambda cur, table, columns, rows: bulk_insert(cur, table, columns, rows, method=load_method))
+    cur = conn.cursor()
+    refresh_availability(cur)
+    cur.close()
+    return {
+        "items": {"inserted": loaded["stock_items"], "updated": 0, "deleted": 0},
+        "movements": {"inserted": loaded["stock_movements"], "updated": 0, "deleted": 0},
+    }, list(range(len(move_data)))
 
-        return {"ok": True, "items": len(items or []), "movements": len(moves or [])}
+def _sync_incremental(cur, item_data, move_data, move_hashes, load_method):
+    """
+    Apply only the difference between the incoming Tally rows and MySQL.
+    Items are keyed by name and compared by content hash; movements are keyed by
+    their content hash (stock_movements.movement_hash), so a changed movement is
+    a delete of the old hash plus an insert of the new one.
+    stock_availability is recomputed for the items touched by either.
+    Returns (counts, indexes of inserted movements).
+    """
+    # --- stock items ---
+    # keyed like the unique name column compares (item_key), so a rename that
+    # only changes case or accents updates the row instead of deleting it
+    cur.execute("SELECT name, category, base_unit, opening_qty, opening_rate FROM stock_items")
+    existing_items = {item_key(r[0]): (r[0], item_fingerprint(r)) for r in cur.fetchall() if r[0]}
+    incoming_items = {item_key(row[0]): row for row in item_data if row[0]}
+
+    new_items = [row for key, row in incoming_items.items() if key not in existing_items]
+    changed_items = [row for key, row in incoming_items.items()
+                     if key in existing_items and existing_items[key][1] != item_fingerprint(row)]
+    vanished_items = [name for key, (name, _) in existing_items.items() if key not in incoming_items]
+
+    if new_items or changed_items:
+        cur.executemany("""
+            INSERT INTO stock_items (name, category, base_unit, opening_qty, opening_rate)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                name=VALUES(name),
+                category=VALUES(category),
+                base_unit=VALUES(base_unit),
+                opening_qty=VALUES(opening_qty),
+                opening_rate=VALUES(opening_rate)
+        """, new_items + changed_items)
+    for chunk in _chunks(vanished_items, SQL_CHUNK_SIZE):
+        placeholders = ",".join(["%s"] * len(chunk))
+        cur.execute(f"DELETE FROM stock_items WHERE name IN ({placeholders})", tuple(chunk))
+
+    # --- stock movements ---
+    cur.execute("SELECT movement_hash, item FROM stock_movements")
+    existing_hashes = {}
+    unhashed = 0
+    for h, item in cur.fetchall():
+        if h is None:
+            unhashed += 1
+        else:
+            existing_hashes[h] = item
+    incoming_hashes = set(move_hashes)
+
+    new_idx = [i for i, h in enumerate(move_hashes) if h not in existing_hashes]
+    vanished_hashes = existing_hashes.keys() - incoming_hashes
+
+    # rows loaded before hashes existed cannot be matched; replace them once
+    if unhashed:
+        cur.execute("DELETE FROM stock_movements WHERE movement_hash IS NULL")
+    for chunk in _chunks(vanished_hashes, SQL_CHUNK_SIZE):
+        placeholders = ",".join(["%s"] * len(chunk))
+        cur.execute(f"DELETE FROM stock_movements WHERE movement_hash IN ({placeholders})", tuple(chunk))
+    # IGNORE: a row committed by an overlapping sync is skipped, not duplicated
+    inserted = bulk_insert(cur, "stock_movements", MOVEMENT_LOAD_COLUMNS,
+                           [move_data[i] + (move_hashes[i],) for i in new_idx],
+                           method=load_method, ignore=True)
+    if inserted != len(new_idx):
+        logging.warning("%d new movements were already present", len(new_idx) - inserted)
+
+    if unhashed:
+        refresh_availability(cur)
+    else:
+        touched = {row[0] for row in new_items + changed_items}
+        touched.update(vanished_items)
+        touched.update(move_data[i][3] for i in new_idx)
+        touched.update(existing_hashes[h] for h in vanished_hashes)
+        refresh_availability(cur, touched)
+
+    return {
+        "items": {"inserted": len(new_items), "updated": len(changed_items), "deleted": len(vanished_items)},
+        "movements": {"inserted": len(new_idx), "updated": 0, "deleted": len(vanished_hashes) + unhashed},
+    }, new_idx
+
+def sync_from_tally(mode=None, load_method=None):
+    mode = (mode or TALLY_SYNC_MODE).lower()
+    if mode not in ("incremental", "swap", "full"):
+        return {"ok": False, "error": f"Unknown sync mode {mode}"}
+    load_method = (load_method or TALLY_LOAD_METHOD).lower()
+    if load_method not in LOAD_METHODS:
+        return {"ok": False, "error": f"Unknown load method {load_method}"}
+
+    timings = {}
+    t0 = time.monotonic()
+    try:
+        fetched = fetch_tally_datasets(("stock_items", "stock_movements"))
     except Exception as e:
+        logging.exception("Tally fetch failed: %s", e)
+        return {"ok": False, "error": f"Tally fetch failed: {e}"}
+    timings["fetch_total"] = round(time.monotonic() - t0, 3)
+    if TALLY_RECORD:
+        try:
+            tally_fixture.write_fixture(TALLY_RECORD, gateway={ep: data for ep, (data, _) in fetched.items()
+                                                             if isinstance(data, list)})
+        except Exception as e:
+            logging.warning("Could not record Tally responses to %s: %s", TALLY_RECORD, e)
+    items, item_stats = fetched["stock_items"]
+    moves, move_stats = fetched["stock_movements"]
+    timings["fetch_stock_items"] = item_stats
+    timings["fetch_stock_movements"] = move_stats
+    if not isinstance(items, list) or not isinstance(moves, list):
+        return {"ok": False, "error": "Tally gateway returned an error payload"}
+
+    item_data = []
+    for i in items or []:
+        item_data.append((
+            i.get("name"),
+            i.get("category"),
+            i.get("base_unit"),
+            i.get("closing_qty", 0),
+            i.get("closing_rate", 0)
+        ))
+
+    move_data = []
+    for m in moves or []:
+        move_data.append((
+            m.get("date"),
+            m.get("voucher_no"),
+            m.get("company"),
+            m.get("item"),
+            m.get("qty", 0),
+            m.get("rate", 0),
+            m.get("amount", 0),
+            m.get("movement_type")
+        ))
+    move_hashes = movement_hashes(move_data)
+
+    t0 = time.monotonic()
+    conn = cur = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        if mode == "full":
+            counts, loaded_idx = _sync_full(cur, item_data, move_data, move_hashes, load_method)
+        elif mode == "swap":
+            counts, loaded_idx = _sync_swap(conn, item_data, move_data, move_hashes, load_method)
+        else:
+            counts, loaded_idx = _sync_incremental(cur, item_data, move_data, move_hashes, load_method)
+        conn.commit()
+    except Exception as e:
+        try:
+            if conn:
+                conn.rollback()
+        except:
+            pass
         logging.exception("sync_from_tally MySQL insert failed: %s", e)
         return {"ok": False, "error": f"MySQL insert failed: {e}"}
+    finally:
+        # outside a request this is a pooled connection the pool only gets back here
+        try:
+            if cur:
+                cur.close()
+            if conn:
+                conn.close()
+        except:
+            pass
+
+    timings["load"] = round(time.monotonic() - t0, 3)
+    logging.info("sync_from_tally (%s, %s): items %s, movements %s",
+                 mode, load_method, counts["items"], counts["movements"])
+
+    # Release reservations for the OUT movements that were just loaded, in one transaction
+    t0 = time.monotonic()
+    released = batch_release_reservations([moves[i] for i in loaded_idx])
+    if not released.get("ok"):
+        logging.error("batch reservation release failed: %s", released.get("error"))
+    timings["release"] = round(time.monotonic() - t0, 3)
+    logging.info("sync_from_tally timings: %s", timings)
+
+    return {"ok": True, "mode": mode, "load_method": load_method, "items": len(items or []), "movements": len(moves or []),
+            "changes": counts, "released": released.get("items", {}), "timings": timings}
+
+# Per-item quantities for pages, read by primary key from the maintained
+# stock_availability table (alias a) joined to stock_items (alias i). Items the
+# table has not seen yet show their full quantity as available. Once the
+# latest counted reservation has run past its end date (reserve_until <
+# today) nothing is reserved any more, even if the maintenance job has not
+# expired those reservations yet.
+_RESERVATIONS_LAPSED = "a.reserve_until < CURDATE()"
+AVAILABILITY_SELECT = f"""COALESCE(a.total_qty, i.opening_qty) AS total_qty,
+       IF({_RESERVATIONS_LAPSED}, 0, COALESCE(a.reserved_qty, 0)) AS reserved_qty,
+       IF({_RESERVATIONS_LAPSED}, a.total_qty, COALESCE(a.available_qty, i.opening_qty)) AS available_qty,
+       IF({_RESERVATIONS_LAPSED}, NULL, a.reserved_by) AS reserved_by"""
+RESERVE_UNTIL = f"IF({_RESERVATIONS_LAPSED}, NULL, a.reserve_until)"
 
 # ---------------------------
 # Routes (UI + debug)
@@ -533,11 +1015,16 @@ def stock_summary():
             item = request.form["item"]
             qty = float(request.form["qty"])
             days = int(request.form.get("days", 2))
+            if days < 1:
+                return "A reservation must last at least one day", 400
             end_date = date.today() + timedelta(days=days)
+            # lock the availability row first (lock order: etl/availability.py)
+            get_availability(cur, [item], lock=True)
             cur.execute("""
                 INSERT INTO stock_reservations (item, reserved_by, qty, start_date, end_date, status)
                 VALUES (%s, %s, %s, CURDATE(), %s, 'ACTIVE')
             """, (item, user, qty, end_date))
+            add_reservation(cur, item, qty, user, date.today(), end_date)
             conn.commit()
             # best-effort email
             try:
@@ -545,14 +1032,7 @@ def stock_summary():
             except Exception:
                 logging.exception("reservation email failed")
 
-        # Auto-expire old reservations
-        cur.execute("""
-            UPDATE stock_reservations
-            SET status='EXPIRED'
-            WHERE status='ACTIVE' AND end_date < CURDATE()
-        """)
-        conn.commit()
-
+        # expiry runs in the reservation maintenance job, not on page views
         if q:
             cur.execute("""
                 SELECT name, category
@@ -604,69 +1084,42 @@ def stock_items(brand):
             end_date = request.form.get("end_date")
             if not end_date:
                 end_date = (date.today() + timedelta(days=3)).strftime("%Y-%m-%d")
+            elif date.fromisoformat(end_date) < date.today():
+                return "The reservation end date is in the past", 400
+            # lock the availability row first (lock order: etl/availability.py)
+            get_availability(cur, [item], lock=True)
             cur.execute("""
                 INSERT INTO stock_reservations (item, reserved_by, qty, start_date, end_date, status)
                 VALUES (%s, %s, %s, CURDATE(), %s, 'ACTIVE')
             """, (item, reserved_by, qty, end_date))
+            add_reservation(cur, item, qty, reserved_by, date.today(), end_date)
             conn.commit()
             try:
                 send_reservation_notification(item, qty, reserved_by, end_date)
             except Exception:
                 logging.exception("reservation email failed")
 
-        # expire old
-        cur.execute("""
-            UPDATE stock_reservations
-            SET status='EXPIRED'
-            WHERE status='ACTIVE' AND end_date < CURDATE()
-        """)
-        conn.commit()
-
-        # cancel reservations that exceed available_qty
-        cur.execute("""
-            UPDATE stock_reservations r
-            JOIN (
-                SELECT i.name AS item,
-                       i.opening_qty - IFNULL(SUM(m.qty), 0) AS available_qty
-                FROM stock_items i
-                LEFT JOIN stock_movements m
-                  ON i.name = m.item AND m.movement_type='OUT'
-                GROUP BY i.name, i.opening_qty
-            ) s ON r.item = s.item
-            SET r.status='CANCELLED'
-            WHERE r.status='ACTIVE' AND r.qty > s.available_qty;
-        """)
-        conn.commit()
-
+        # expiry and over-reservation cancellation run in the reservation
+        # maintenance job; quantities come from stock_availability
         search_query = request.args.get("q", "").strip()
         if search_query:
-            cur.execute("""
+            cur.execute(f"""
                 SELECT i.name AS item,
-                       i.opening_qty AS total_qty,
-                       IFNULL(SUM(r.qty), 0) AS reserved_qty,
-                       (i.opening_qty - IFNULL(SUM(r.qty), 0)) AS available_qty,
-                       MAX(r.reserved_by) AS reserved_by,
-                       DATE_FORMAT(MAX(r.end_date), '%%Y-%%m-%%d') AS end_date
+                       {AVAILABILITY_SELECT},
+                       DATE_FORMAT({RESERVE_UNTIL}, '%%Y-%%m-%%d') AS end_date
                 FROM stock_items i
-                LEFT JOIN stock_reservations r
-                  ON i.name = r.item AND r.status='ACTIVE'
+                LEFT JOIN stock_availability a ON a.item = i.name
                 WHERE i.category=%s AND i.name LIKE %s
-                GROUP BY i.name, i.opening_qty
                 ORDER BY i.name
             """, (brand, f"%{search_query}%"))
         else:
-            cur.execute("""
+            cur.execute(f"""
                 SELECT i.name AS item,
-                       i.opening_qty AS total_qty,
-                       IFNULL(SUM(r.qty), 0) AS reserved_qty,
-                       (i.opening_qty - IFNULL(SUM(r.qty), 0)) AS available_qty,
-                       MAX(r.reserved_by) AS reserved_by,
-                       DATE_FORMAT(MAX(r.end_date), '%%d-%%m-%%Y') AS end_date
+                       {AVAILABILITY_SELECT},
+                       DATE_FORMAT({RESERVE_UNTIL}, '%%d-%%m-%%Y') AS end_date
                 FROM stock_items i
-                LEFT JOIN stock_reservations r
-                  ON i.name = r.item AND r.status='ACTIVE'
+                LEFT JOIN stock_availability a ON a.item = i.name
                 WHERE i.category=%s
-                GROUP BY i.name, i.opening_qty
                 ORDER BY i.name
             """, (brand,))
 
@@ -705,8 +1158,17 @@ def stock_items(brand):
 # ---------------------------
 def send_reservation_notification(item, qty, user, end_date):
     body = f"{user} reserved {qty} units of {item} until {end_date}."
+    _send_notification("Stock Reserved Notification", body)
+
+def send_bulk_reservation_notification(lines, user, end_date):
+    """One email for a multi-item reservation; `lines` is [(item, qty)]."""
+    body = f"{user} reserved {len(lines)} lines until {end_date}:\n"
+    body += "\n".join(f"- {qty} units of {item}" for item, qty in lines)
+    _send_notification("Stock Reserved Notification", body)
+
+def _send_notification(subject, body):
     msg = MIMEText(body)
-    msg["Subject"] = "Stock Reserved Notification"
+    msg["Subject"] = subject
     sender = os.getenv("EMAIL_USER", "yourapp@example.com")
     receivers = os.getenv("EMAIL_NOTIFY", "team@example.com")
     msg["From"] = sender
@@ -732,29 +1194,201 @@ def send_reservation_notification(item, qty, user, end_date):
         logging.exception("Email sending failed")
 
 # ---------------------------
-# Auto-release simple function (keeps lightweight behaviour)
+# Reservation maintenance (scheduled job instead of write-on-read in pages)
+# - expire ACTIVE reservations past end_date, in short batches
+# - cancel ACTIVE reservations larger than the item's available qty, checking
+#   a bounded slice of reserved items per run (keyset cursor that wraps around,
+#   persisted in maintenance_state)
+# Only one runner at a time across processes (GET_LOCK). Run it as a worker
+# (`python maintenance.py`) or in-process with RESERVATION_MAINTENANCE_THREAD=1.
+# Without it, availability reads still treat reservations past their end date
+# as released (AVAILABILITY_SELECT, get_availability); they just stay ACTIVE.
 # ---------------------------
-def auto_release_reservations():
-    """Auto-cancel reservations that exceed available qty (sold in stock_movements)."""
-    conn = None
+MAINTENANCE_LOCK_NAME = "inventory_reservation_maintenance"
+MAINTENANCE_INTERVAL = int(os.getenv("RESERVATION_MAINTENANCE_INTERVAL", 60))
+MAINTENANCE_EXPIRE_BATCH = int(os.getenv("RESERVATION_EXPIRE_BATCH", 1000))
+MAINTENANCE_CHECK_ITEMS = int(os.getenv("RESERVATION_CHECK_ITEMS", 500))
+MAINTENANCE_CURSOR = "reservation_check"
+
+# fallback when maintenance_state does not exist yet (schema.sql not applied)
+_maintenance_cursor = {"value": None}
+
+def _expire_reservations(conn, batch):
+    cur = conn.cursor()
+    total = 0
+    while True:
+        cur.execute("""
+            SELECT id, item FROM stock_reservations
+            WHERE status='ACTIVE' AND end_date < CURDATE()
+            ORDER BY id
+            LIMIT %s
+        """, (batch,))
+        rows = cur.fetchall()
+        ids = []
+        if rows:
+            # availability rows first, then the reservations (re-checked under
+            # the lock), like every other reservation writer
+            items = {item for _, item in rows}
+            get_availability(cur, items, lock=True)
+            placeholders = ",".join(["%s"] * len(rows))
+            cur.execute(f"""
+                SELECT id FROM stock_reservations
+                WHERE status='ACTIVE' AND end_date < CURDATE() AND id IN ({placeholders})
+                FOR UPDATE
+            """, tuple(rid for rid, _ in rows))
+            ids = [rid for (rid,) in cur.fetchall()]
+            if ids:
+                placeholders = ",".join(["%s"] * len(ids))
+                cur.execute(f"UPDATE stock_reservations SET status='EXPIRED' WHERE id IN ({placeholders})",
+                            tuple(ids))
+                refresh_reserved(cur, items)
+        conn.commit()
+        total += len(ids)
+        if len(rows) < batch:
+            break
+    cur.close()
+    return total
+
+def _read_maintenance_cursor(cur):
+    try:
+        cur.execute("SELECT cursor_value FROM maintenance_state WHERE name=%s", (MAINTENANCE_CURSOR,))
+        row = cur.fetchone()
+        return row[0] if row else None
+    except mysql.connector.Error:
+        return _maintenance_cursor["value"]
+
+def _save_maintenance_cursor(conn, value):
+    _maintenance_cursor["value"] = value
+    cur = conn.cursor()
     try:
-        conn = get_connection()
-        cur = conn.cursor()
         cur.execute("""
-            UPDATE stock_reservations r
-            JOIN (
-                SELECT i.name AS item,
-                       i.opening_qty - IFNULL(SUM(m.qty), 0) AS available_qty
-                FROM stock_items i
-                LEFT JOIN stock_movements m
-                  ON i.name = m.item AND m.movement_type='OUT'
-                GROUP BY i.name, i.opening_qty
-            ) s ON r.item = s.item
-            SET r.status='CANCELLED'
-            WHERE r.status='ACTIVE' AND r.qty > s.available_qty;
-        """)
+            INSERT INTO maintenance_state (name, cursor_value) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE cursor_value=VALUES(cursor_value)
+        """, (MAINTENANCE_CURSOR, value))
+        conn.commit()
+    except mysql.connector.Error as e:
+        logging.warning("maintenance_state not available (%s); keeping the cursor in memory", e)
+    finally:
+        cur.close()
+
+def _cancel_over_reservations(conn, after=None, limit=None):
+    """
+    Cancel ACTIVE reservations whose qty exceeds the item's available qty
+    (total - sold in stock_availability), for up to `limit` reserved items
+    ordered by name after `after`.
+    Returns (cancelled ids, last item checked or None once the end is reached).
+    """
+    cur = conn.cursor()
+    sql = """
+        SELECT item FROM stock_availability
+        WHERE reserved_qty > 0 AND item > %s ORDER BY item
+    """
+    params = [after or ""]
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    cur.execute(sql, tuple(params))
+    items = [item for (item,) in cur.fetchall()]
+    if not items:
+        cur.close()
+        return [], None
+
+    # lock the availability rows before reading the reservations (the lock
+    # order of every reservation writer) and take the quantities from them
+    available = {item_key(a["item"]): float(a["total_qty"] or 0) - float(a["sold_qty"] or 0)
+                 for a in get_availability(cur, items, lock=True).values()}
+    reservations = []
+    for chunk in _chunks(items, SQL_CHUNK_SIZE):
+        placeholders = ",".join(["%s"] * len(chunk))
+        cur.execute(f"""
+            SELECT id, item, qty FROM stock_reservations
+            WHERE status='ACTIVE' AND item IN ({placeholders})
+            FOR UPDATE
+        """, tuple(chunk))
+        reservations.extend(cur.fetchall())
+
+    cancel = [(rid, item) for rid, item, qty in reservations
+              if item_key(item) in available and float(qty) > available[item_key(item)]]
+    for chunk in _chunks(cancel, SQL_CHUNK_SIZE):
+        placeholders = ",".join(["%s"] * len(chunk))
+        cur.execute(f"""
+            UPDATE stock_reservations SET status='CANCELLED'
+            WHERE status='ACTIVE' AND id IN ({placeholders})
+        """, tuple(rid for rid, _ in chunk))
+    refresh_reserved(cur, {item for _, item in cancel})
+    conn.commit()
+    cur.close()
+    last = items[-1] if limit and len(items) == limit else None
+    return [rid for rid, _ in cancel], last
+
+def run_reservation_maintenance():
+    """
+    One maintenance pass. Returns its stats, or None when another process is
+    already running it.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT GET_LOCK(%s, 0)", (MAINTENANCE_LOCK_NAME,))
+        if cur.fetchone()[0] != 1:
+            logging.info("Reservation maintenance already running elsewhere; skipping")
+            return None
+        try:
+            t0 = time.monotonic()
+            expired = _expire_reservations(conn, MAINTENANCE_EXPIRE_BATCH)
+            after = _read_maintenance_cursor(cur)
+            cancelled, last = _cancel_over_reservations(conn, after, MAINTENANCE_CHECK_ITEMS)
+            _save_maintenance_cursor(conn, last)
+            stats = {"expired": expired, "cancelled": len(cancelled), "checked_after": after,
+                     "next_cursor": last, "seconds": round(time.monotonic() - t0, 3)}
+            if expired or cancelled:
+                logging.info("Reservation maintenance: %s", stats)
+            return stats
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (MAINTENANCE_LOCK_NAME,))
+            cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+def _maintenance_job():
+    try:
+        run_reservation_maintenance()
+    except Exception:
+        logging.exception("reservation maintenance failed")
+
+def reservation_maintenance_loop():
+    """Run the maintenance job every MAINTENANCE_INTERVAL seconds, forever."""
+    scheduler = schedule.Scheduler()
+    scheduler.every(MAINTENANCE_INTERVAL).seconds.do(_maintenance_job)
+    _maintenance_job()
+    while True:
+        scheduler.run_pending()
+        time.sleep(1)
+
+def start_reservation_maintenance_thread():
+    t = threading.Thread(target=reservation_maintenance_loop, name="reservation-maintenance", daemon=True)
+    t.start()
+    return t
+
+def rebuild_stock_availability():
+    """Recompute stock_availability for every item (backfill or repair)."""
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        refresh_availability(cur)
         conn.commit()
+    finally:
         cur.close()
+        conn.close()
+
+def auto_release_reservations():
+    """Auto-cancel reservations that exceed available qty (sold in stock_movements), all items at once."""
+    conn = None
+    try:
+        conn = get_connection()
+        cancelled, _ = _cancel_over_reservations(conn)
+        return len(cancelled)
     except Exception:
         logging.exception("auto_release_reservations error")
     finally:
@@ -763,6 +1397,9 @@ def auto_release_reservations():
                 conn.close()
         except:
             pass
+
+if os.getenv("RESERVATION_MAINTENANCE_THREAD") == "1":
+    start_reservation_maintenance_thread()
 # JSON POST login used by mobile / flutter clients (accepts JSON body)
 @app.route("/flask/login", methods=["POST", "OPTIONS"])
 def api_flask_login():
@@ -1164,16 +1801,11 @@ def api_stock_items(brand):
         if allowed is None:
             cur.execute(f"""
                 SELECT i.name AS item,
-                       i.opening_qty AS total_qty,
-                       IFNULL(SUM(r.qty), 0) AS reserved_qty,
-                       (i.opening_qty - IFNULL(SUM(r.qty), 0)) AS available_qty,
-                       MAX(r.reserved_by) AS reserved_by,
-                       MAX(r.end_date) AS end_date
+                       {AVAILABILITY_SELECT},
+                       {RESERVE_UNTIL} AS end_date
                 FROM stock_items i
-                LEFT JOIN stock_reservations r
-                  ON i.name = r.item AND r.status='ACTIVE'
+                LEFT JOIN stock_availability a ON a.item = i.name
                 WHERE {brand_expr} = %s
-                GROUP BY i.name, i.opening_qty
                 ORDER BY i.name
             """, (decoded_norm,))
             rows = cur.fetchall() or []
@@ -1208,16 +1840,11 @@ def api_stock_items(brand):
         if decoded_norm in allowed_norm:
             cur.execute(f"""
                 SELECT i.name AS item,
-                       i.opening_qty AS total_qty,
-                       IFNULL(SUM(r.qty), 0) AS reserved_qty,
-                       (i.opening_qty - IFNULL(SUM(r.qty), 0)) AS available_qty,
-                       MAX(r.reserved_by) AS reserved_by,
-                       MAX(r.end_date) AS end_date
+                       {AVAILABILITY_SELECT},
+                       {RESERVE_UNTIL} AS end_date
                 FROM stock_items i
-                LEFT JOIN stock_reservations r
-                  ON i.name = r.item AND r.status='ACTIVE'
+                LEFT JOIN stock_availability a ON a.item = i.name
                 WHERE {brand_expr} = %s
-                GROUP BY i.name, i.opening_qty
                 ORDER BY i.name
             """, (decoded_norm,))
             rows = cur.fetchall() or []
@@ -1245,18 +1872,13 @@ def api_stock_items(brand):
         params = allowed["params"].copy()
         params.insert(0, decoded_brand)
         sql = f"""
-            SELECT DISTINCT i.name AS item,
-                   i.opening_qty AS total_qty,
-                   IFNULL(SUM(r.qty), 0) AS reserved_qty,
-                   (i.opening_qty - IFNULL(SUM(r.qty), 0)) AS available_qty,
-                   MAX(r.reserved_by) AS reserved_by,
-                   MAX(r.end_date) AS end_date
+            SELECT i.name AS item,
+                   {AVAILABILITY_SELECT},
+                   {RESERVE_UNTIL} AS end_date
             FROM stock_items i
-            LEFT JOIN stock_reservations r
-              ON i.name = r.item AND r.status='ACTIVE'
-            JOIN stock_movements m ON m.item = i.name
-            WHERE {brand_expr} = LOWER(TRIM(%s)) AND ({company_where})
-            GROUP BY i.name, i.opening_qty
+            LEFT JOIN stock_availability a ON a.item = i.name
+            WHERE {brand_expr} = LOWER(TRIM(%s))
+              AND EXISTS (SELECT 1 FROM stock_movements m WHERE m.item = i.name AND ({company_where}))
             ORDER BY i.name
         """
         cur.execute(sql, tuple(params))
@@ -1295,25 +1917,18 @@ def api_search():
     cur = conn.cursor(dictionary=True)
     try:
         like = f"%{q}%"
-        cur.execute("""
+        cur.execute(f"""
             SELECT
                 i.name AS item,
                 i.name AS name,
                 i.category,
                 i.base_unit,
-                i.opening_qty AS total_qty,
-                IFNULL(SUM(r.qty), 0) AS reserved_qty,
-                (i.opening_qty - IFNULL(SUM(r.qty), 0)) AS available_qty,
-                MAX(r.reserved_by) AS reserved_by,
-                DATE_FORMAT(MAX(r.end_date), '%d-%m-%y') AS reserve_until,
+                {AVAILABILITY_SELECT},
+                DATE_FORMAT({RESERVE_UNTIL}, '%d-%m-%y') AS reserve_until,
                 (i.opening_qty * COALESCE(i.opening_rate, 0)) AS value
             FROM stock_items i
-            LEFT JOIN stock_reservations r
-              ON r.item = i.name
-              AND r.status = 'ACTIVE'
-              AND (r.end_date IS NULL OR r.end_date >= CURDATE())
+            LEFT JOIN stock_availability a ON a.item = i.name
             WHERE i.name LIKE %s OR i.category LIKE %s
-            GROUP BY i.id, i.name, i.category, i.base_unit, i.opening_qty, i.opening_rate
             ORDER BY i.category, i.name
         """, (like, like))
         results = cur.fetchall() or []
@@ -1348,10 +1963,15 @@ def api_stock_reserve():
         qty = float(data.get("qty", 0))
     except Exception:
         return jsonify({"ok": False, "error": "Invalid qty"}), 400
-    days = int(data.get("days", 3)) if data.get("days") is not None else 3
+    try:
+        days = int(data["days"]) if data.get("days") is not None else 3
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid days"}), 400
     reserved_by = data.get("reserved_by") or session.get("user") or "mobile"
     if not item or qty <= 0:
         return jsonify({"ok": False, "error": "Missing or invalid item/qty"}), 400
+    if days < 1:
+        return jsonify({"ok": False, "error": "days must be at least 1"}), 400
     end_date = date.today() + timedelta(days=days)
 
     conn = None
@@ -1359,22 +1979,20 @@ def api_stock_reserve():
         conn = get_connection()
         conn.start_transaction()
         cur = conn.cursor(dictionary=True)
-        # lock item
-        cur.execute("SELECT name, opening_qty FROM stock_items WHERE name=%s FOR UPDATE", (item,))
-        item_row = cur.fetchone()
-        if not item_row:
-            conn.rollback()
-            return jsonify({"ok": False, "error": f"Item '{item}' not found"}), 404
-        total_qty = float(item_row.get("opening_qty") or 0)
-        cur.execute("""
-            SELECT IFNULL(SUM(r.qty), 0) AS reserved_qty
-            FROM stock_reservations r
-            WHERE r.item = %s AND r.status='ACTIVE' AND (r.end_date IS NULL OR r.end_date >= CURDATE())
-            FOR UPDATE
-        """, (item,))
-        sum_row = cur.fetchone()
-        reserved_qty = float(sum_row.get("reserved_qty") or 0)
-        available_qty = max(0.0, total_qty - reserved_qty)
+        # lock the item's availability row; it serializes reservations of the item.
+        # Rows are keyed by the stored name, which may differ in case/accents
+        # from the one sent (the collation matches them), so take the row as is.
+        avail = next(iter(get_availability(cur, [item], lock=True).values()), None)
+        if avail is None:
+            cur.execute("SELECT name FROM stock_items WHERE name=%s FOR UPDATE", (item,))
+            found = cur.fetchone()
+            if not found:
+                conn.rollback()
+                return jsonify({"ok": False, "error": f"Item '{item}' not found"}), 404
+            refresh_availability(cur, [found["name"]])
+            avail = get_availability(cur, [found["name"]], lock=True)[found["name"]]
+        item = avail["item"]
+        available_qty = max(0.0, float(avail["available_qty"] or 0))
         if qty > available_qty:
             conn.rollback()
             return jsonify({"ok": False, "error": f"Only {available_qty} available; cannot reserve {qty}"}), 400
@@ -1383,23 +2001,18 @@ def api_stock_reserve():
             INSERT INTO stock_reservations (item, reserved_by, qty, start_date, end_date, status)
             VALUES (%s, %s, %s, CURDATE(), %s, 'ACTIVE')
         """, (item, reserved_by, qty, end_date))
-
-        cur.execute("""
-            SELECT 
-                i.name AS item,
-                i.opening_qty AS total_qty,
-                IFNULL(SUM(r.qty), 0) AS reserved_qty,
-                (i.opening_qty - IFNULL(SUM(r.qty), 0)) AS available_qty,
-                MAX(r.reserved_by) AS reserved_by,
-                MAX(r.start_date) AS max_start_date,
-                MAX(r.end_date) AS max_end_date
-            FROM stock_items i
-            LEFT JOIN stock_reservations r
-              ON r.item = i.name AND r.status='ACTIVE' AND (r.end_date IS NULL OR r.end_date >= CURDATE())
-            WHERE i.name=%s
-            GROUP BY i.name, i.opening_qty
-        """, (item,))
-        agg = cur.fetchone() or {}
+        add_reservation(cur, item, qty, reserved_by, date.today(), end_date)
+
+        a = get_availability(cur, [item])[item]
+        agg = {
+            "item": item,
+            "total_qty": a["total_qty"],
+            "reserved_qty": a["reserved_qty"],
+            "available_qty": a["available_qty"],
+            "reserved_by": a["reserved_by"],
+            "max_start_date": a["reserve_from"],
+            "max_end_date": a["reserve_until"],
+        }
 
         def _fmt_date_obj(val):
             if val is None:
@@ -1443,6 +2056,166 @@ def api_stock_reserve():
         except:
             pass
 
+# ---------------------------
+# Bulk reservation (a whole quote in one transaction)
+# - every line is checked against stock_availability and nothing is reserved
+#   unless all of them fit
+# - availability rows are locked with one FOR UPDATE read in item order, so
+#   overlapping bulk requests wait for each other instead of deadlocking
+# - one multi-row INSERT for the reservations, one UPDATE for availability;
+#   the aggregates returned are computed from the locked rows
+# ---------------------------
+BULK_RESERVE_MAX_LINES = int(os.getenv("BULK_RESERVE_MAX_LINES", 200))
+BULK_RESERVE_RETRIES = int(os.getenv("BULK_RESERVE_RETRIES", 3))
+# ER_LOCK_WAIT_TIMEOUT, ER_LOCK_DEADLOCK
+RETRYABLE_LOCK_ERRNOS = {1205, 1213}
+
+def _fmt_reservation_date(val):
+    if val is None:
+        return None
+    if isinstance(val, (datetime, date)):
+        return val.strftime("%d-%m-%Y")
+    try:
+        return datetime.fromisoformat(str(val)).date().strftime("%d-%m-%Y")
+    except Exception:
+        return str(val)
+
+def reserve_items(conn, lines, reserved_by, end_date):
+    """
+    Reserve every (item, qty) line in one transaction on `conn`.
+    Returns (response dict, http status). Items are matched like MySQL
+    compares names (any case) and reserved under their stored names; repeated
+    items are checked against their combined qty but keep one reservation
+    per line.
+    """
+    requested = {item for item, _ in lines}
+    start_date = date.today()
+
+    conn.start_transaction()
+    cur = conn.cursor(dictionary=True)
+    try:
+        # items the availability table has not seen yet get their row first
+        seen = {item_key(name) for name in get_availability(cur, requested)}
+        missing = {item for item in requested if item_key(item) not in seen}
+        if missing:
+            refresh_availability(cur, missing)
+        avail = get_availability(cur, requested, lock=True)
+
+        stored = {item_key(name): name for name in avail}
+        unknown = sorted(item for item in requested if item_key(item) not in stored)
+        if unknown:
+            conn.rollback()
+            return {"ok": False, "error": "Items not found", "unknown_items": unknown}, 404
+        lines = [(stored[item_key(item)], qty) for item, qty in lines]
+        wanted = {}
+        for item, qty in lines:
+            wanted[item] = wanted.get(item, 0.0) + qty
+
+        shortages = []
+        for item in sorted(wanted):
+            available_qty = max(0.0, float(avail[item]["available_qty"] or 0))
+            if wanted[item] > available_qty:
+                shortages.append({"item": item, "requested": wanted[item], "available": available_qty})
+        if shortages:
+            conn.rollback()
+            return {"ok": False, "error": "Insufficient stock", "shortages": shortages}, 400
+
+        # executemany collapses into a single multi-row INSERT
+        cur.executemany("""
+            INSERT INTO stock_reservations (item, reserved_by, qty, start_date, end_date, status)
+            VALUES (%s, %s, %s, %s, %s, 'ACTIVE')
+        """, [(item, reserved_by, qty, start_date, end_date) for item, qty in lines])
+        add_reservations(cur, wanted, reserved_by, start_date, end_date)
+
+        aggregates = {}
+        for item in sorted(wanted):
+            a = avail[item]
+            total_qty = float(a["total_qty"] or 0)
+            reserved_qty = float(a["reserved_qty"] or 0) + wanted[item]
+            aggregates[item] = {
+                "item": item,
+                "total_qty": total_qty,
+                "reserved_qty": round(reserved_qty, 4),
+                "available_qty": round(total_qty - reserved_qty, 4),
+                "reserved_by": max(a["reserved_by"] or "", reserved_by),
+                "reserve_until": _fmt_reservation_date(max(a["reserve_until"] or end_date, end_date)),
+                "last_reserve_start": _fmt_reservation_date(max(a["reserve_from"] or start_date, start_date)),
+            }
+        conn.commit()
+    finally:
+        cur.close()
+
+    return {
+        "ok": True,
+        "msg": f"Reserved {len(lines)} lines",
+        "reservations": [{"item": item, "qty": qty, "end_date": str(end_date), "reserved_by": reserved_by}
+                         for item, qty in lines],
+        "aggregates": aggregates,
+    }, 200
+
+@app.route("/api/stock-reserve/bulk", methods=["POST"])
+def api_stock_reserve_bulk():
+    data = request.get_json() or {}
+    raw_lines = data.get("items")
+    if not isinstance(raw_lines, list) or not raw_lines:
+        return jsonify({"ok": False, "error": "Missing items"}), 400
+    if len(raw_lines) > BULK_RESERVE_MAX_LINES:
+        return jsonify({"ok": False, "error": f"At most {BULK_RESERVE_MAX_LINES} lines per request"}), 400
+    lines = []
+    for n, line in enumerate(raw_lines, 1):
+        if not isinstance(line, dict):
+            return jsonify({"ok": False, "error": f"Line {n}: expected an object"}), 400
+        item = line.get("item")
+        try:
+            qty = float(line.get("qty", 0))
+        except Exception:
+            return jsonify({"ok": False, "error": f"Line {n}: invalid qty"}), 400
+        if not item or qty <= 0:
+            return jsonify({"ok": False, "error": f"Line {n}: missing or invalid item/qty"}), 400
+        lines.append((item, qty))
+    try:
+        days = int(data["days"]) if data.get("days") is not None else 3
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid days"}), 400
+    if days < 1:
+        return jsonify({"ok": False, "error": "days must be at least 1"}), 400
+    reserved_by = data.get("reserved_by") or session.get("user") or "mobile"
+    end_date = date.today() + timedelta(days=days)
+
+    conn = None
+    try:
+        conn = get_connection()
+        for attempt in range(1, BULK_RESERVE_RETRIES + 1):
+            try:
+                payload, status = reserve_items(conn, lines, reserved_by, end_date)
+                break
+            except mysql.connector.Error as e:
+                conn.rollback()
+                if e.errno not in RETRYABLE_LOCK_ERRNOS or attempt == BULK_RESERVE_RETRIES:
+                    raise
+                logging.warning("bulk reservation lock conflict (%s), retry %d", e, attempt)
+        if payload["ok"]:
+            # best-effort email
+            try:
+                send_bulk_reservation_notification(lines, reserved_by, end_date)
+            except Exception:
+                logging.exception("reservation email failed")
+        return jsonify(convert_decimals(payload)), status
+    except Exception as e:
+        logging.exception("api_stock_reserve_bulk error: %s", e)
+        if conn:
+            try:
+                conn.rollback()
+            except:
+                pass
+        return jsonify({"ok": False, "error": f"DB error: {e}"}), 500
+    finally:
+        try:
+            if conn:
+                conn.close()
+        except:
+            pass
+
 @app.route("/api/reservations")
 def api_reservations():
     items_param = request.args.get("items", "").strip()
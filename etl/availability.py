@@ -0,0 +1,213 @@
+"""
+Maintained per-item availability (MySQL, `stock_availability` table).
+
+One row per stock item with total (opening_qty), sold (OUT movements),
+reserved (ACTIVE, unexpired reservations) and available (total - reserved)
+quantities, plus the latest reservation dates, so pages read availability by
+primary key instead of aggregating stock_movements and stock_reservations.
+
+Writers keep it current inside their own transaction:
+- a sync or ETL load calls refresh_availability() for the items it touched
+  (or for all items after a full reload);
+- creating reservations calls add_reservation() (add_reservations() for
+  several items in one transaction);
+- releasing, expiring or cancelling reservations calls refresh_reserved()
+  for the affected items.
+Helpers take a mysql-connector cursor (tuple or dictionary) and never commit.
+
+Lock order: every writer locks the affected stock_availability rows first
+(get_availability(lock=True), in item order) and only then reads FOR UPDATE,
+inserts or changes stock_reservations, so reservation and release
+transactions queue up on the same rows instead of deadlocking.
+"""
+
+import unicodedata
+
+CHUNK_SIZE = 500
+
+AVAILABILITY_COLUMNS = ("item", "total_qty", "sold_qty", "reserved_qty", "available_qty",
+                        "reserved_by", "reserve_from", "reserve_until")
+
+# ACTIVE reservations that still count against stock
+_RESERVED_WHERE = "status='ACTIVE' AND (end_date IS NULL OR end_date >= CURDATE())"
+
+
+def item_key(name):
+    """
+    Approximate the utf8mb4_0900_ai_ci comparison of the name columns (case
+    and accent insensitive), so names can be matched in Python the way MySQL
+    matches them: requested items to the stored names get_availability()
+    returns, or dimension names in the loader's id cache.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _chunks(seq, size=CHUNK_SIZE):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _refresh(cur, items):
+    """Recompute every column for `items` (all items when None)."""
+    if items is None:
+        mov_filter = res_filter = item_filter = ""
+        params = ()
+    else:
+        placeholders = ",".join(["%s"] * len(items))
+        mov_filter = res_filter = f" AND item IN ({placeholders})"
+        item_filter = f" AND i.name IN ({placeholders})"
+        params = tuple(items) * 3
+    cur.execute(f"""
+        INSERT INTO stock_availability (item, total_qty, sold_qty, reserved_qty,
+                                        reserved_by, reserve_from, reserve_until)
+        SELECT i.name, IFNULL(i.opening_qty, 0), IFNULL(s.sold_qty, 0), IFNULL(r.reserved_qty, 0),
+               r.reserved_by, r.reserve_from, r.reserve_until
+        FROM stock_items i
+        LEFT JOIN (
+            SELECT item, SUM(qty) AS sold_qty FROM stock_movements
+            WHERE movement_type='OUT'{mov_filter}
+            GROUP BY item
+        ) s ON s.item = i.name
+        LEFT JOIN (
+            SELECT item, SUM(qty) AS reserved_qty, MAX(reserved_by) AS reserved_by,
+                   MAX(start_date) AS reserve_from, MAX(end_date) AS reserve_until
+            FROM stock_reservations
+            WHERE {_RESERVED_WHERE}{res_filter}
+            GROUP BY item
+        ) r ON r.item = i.name
+        WHERE i.name IS NOT NULL{item_filter}
+        ON DUPLICATE KEY UPDATE
+            item=VALUES(item),
+            total_qty=VALUES(total_qty),
+            sold_qty=VALUES(sold_qty),
+            reserved_qty=VALUES(reserved_qty),
+            reserved_by=VALUES(reserved_by),
+            reserve_from=VALUES(reserve_from),
+            reserve_until=VALUES(reserve_until)
+    """, params)
+    # rows of items that are gone from stock_items
+    if items is None:
+        cur.execute("""
+            DELETE a FROM stock_availability a
+            LEFT JOIN stock_items i ON i.name = a.item
+            WHERE i.name IS NULL
+        """)
+    else:
+        cur.execute(f"""
+            DELETE a FROM stock_availability a
+            LEFT JOIN stock_items i ON i.name = a.item
+            WHERE i.name IS NULL AND a.item IN ({placeholders})
+        """, tuple(items))
+
+
+def refresh_availability(cur, items=None):
+    """
+    Recompute the rows of `items` from stock_items, stock_movements and
+    stock_reservations, adding and removing rows as items come and go.
+    With items=None the whole table is rebuilt.
+    """
+    if items is None:
+        _refresh(cur, None)
+        return
+    for chunk in _chunks(sorted({i for i in items if i})):
+        _refresh(cur, chunk)
+
+
+def refresh_reserved(cur, items):
+    """Recompute the reservation columns of `items` after reservations were released, expired or cancelled."""
+    for chunk in _chunks(sorted({i for i in items if i})):
+        placeholders = ",".join(["%s"] * len(chunk))
+        cur.execute(f"""
+            UPDATE stock_availability a
+            LEFT JOIN (
+                SELECT item, SUM(qty) AS reserved_qty, MAX(reserved_by) AS reserved_by,
+                       MAX(start_date) AS reserve_from, MAX(end_date) AS reserve_until
+                FROM stock_reservations
+                WHERE {_RESERVED_WHERE} AND item IN ({placeholders})
+                GROUP BY item
+            ) r ON r.item = a.item
+            SET a.reserved_qty = IFNULL(r.reserved_qty, 0),
+                a.reserved_by = r.reserved_by,
+                a.reserve_from = r.reserve_from,
+                a.reserve_until = r.reserve_until
+            WHERE a.item IN ({placeholders})
+        """, tuple(chunk) * 2)
+
+
+def add_reservation(cur, item, qty, reserved_by, start_date, end_date):
+    """Account for one new ACTIVE reservation of `item`."""
+    cur.execute("""
+        UPDATE stock_availability
+        SET reserved_qty = reserved_qty + %s,
+            reserved_by = GREATEST(IFNULL(reserved_by, ''), %s),
+            reserve_from = GREATEST(IFNULL(reserve_from, %s), %s),
+            reserve_until = GREATEST(IFNULL(reserve_until, %s), %s)
+        WHERE item = %s
+    """, (qty, reserved_by, start_date, start_date, end_date, end_date, item))
+    if cur.rowcount == 0:
+        # item not seen by the table yet; the new reservation is already visible
+        # to this transaction, so a recompute includes it
+        refresh_availability(cur, [item])
+
+
+def add_reservations(cur, quantities, reserved_by, start_date, end_date):
+    """
+    Account for new ACTIVE reservations of several items made together
+    ({item: total qty}), with one UPDATE per chunk. The rows must exist; lock
+    them with get_availability(lock=True) first.
+    """
+    for chunk in _chunks(sorted(quantities)):
+        cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+        placeholders = ",".join(["%s"] * len(chunk))
+        params = [v for item in chunk for v in (item, quantities[item])]
+        params += [reserved_by, start_date, start_date, end_date, end_date]
+        params += chunk
+        cur.execute(f"""
+            UPDATE stock_availability
+            SET reserved_qty = reserved_qty + CASE item {cases} END,
+                reserved_by = GREATEST(IFNULL(reserved_by, ''), %s),
+                reserve_from = GREATEST(IFNULL(reserve_from, %s), %s),
+                reserve_until = GREATEST(IFNULL(reserve_until, %s), %s)
+            WHERE item IN ({placeholders})
+        """, tuple(params))
+
+
+def get_availability(cur, items, lock=False):
+    """
+    Return {item: row dict} for `items`, read by primary key. With `lock`
+    the rows are locked FOR UPDATE in item order, so concurrent callers
+    locking several items cannot deadlock each other.
+
+    Rows whose reservations have all run past their end date (reserve_until
+    before today) but were not expired yet read as unreserved; when locking,
+    they are recomputed first so new reservations add to current figures.
+    """
+    out = {}
+    cols = ", ".join(AVAILABILITY_COLUMNS)
+    lapsed = []
+    for chunk in _chunks(sorted({i for i in items if i})):
+        placeholders = ",".join(["%s"] * len(chunk))
+        cur.execute(f"""
+            SELECT {cols}, reserve_until < CURDATE() AS lapsed FROM stock_availability
+            WHERE item IN ({placeholders})
+            ORDER BY item
+            {"FOR UPDATE" if lock else ""}
+        """, tuple(chunk))
+        for row in cur.fetchall():
+            if isinstance(row, dict):
+                row = dict(row)
+                is_lapsed = row.pop("lapsed")
+            else:
+                is_lapsed = row[-1]
+                row = dict(zip(AVAILABILITY_COLUMNS, row))
+            if is_lapsed:
+                lapsed.append(row["item"])
+                row.update(reserved_qty=0, available_qty=row["total_qty"], reserved_by=None,
+                           reserve_from=None, reserve_until=None)
+            out[row["item"]] = row
+    if lock and lapsed:
+        refresh_reserved(cur, lapsed)
+        out.update(get_availability(cur, lapsed, lock=True))
+    return out
@@ -0,0 +1,289 @@
+"""
+ETL / sync benchmark suite.
+
+Seeds synthetic Tally fixtures (tally_fixture.py) at several scales and times
+each stage against SQLite and, when reachable, a local MySQL bench database:
+
+- etl:    ETLPipeline extract / transform / load
+- sync:   app.sync_from_tally() full reload, then an incremental re-sync
+- loader: load_to_mysql.run_loader() (only if its tables exist in the bench db)
+
+Every (scale, target) runs in a fresh process, so peak RSS is per run. Results
+go to bench_results/<timestamp>.json; with --baseline the run fails (exit 1)
+when a stage's rows/sec drops more than --threshold below the baseline.
+
+    python benchmark.py --scales 10k,100k,1m
+    python benchmark.py --scales 10k --baseline ../bench_results/baseline.json
+    python benchmark.py --scales 10k,100k --save-baseline
+
+The MySQL bench database (BENCH_MYSQL_DB, default inventory_bench) is
+dropped and refilled; it must not be the live MYSQL_DB.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = PROJECT_ROOT / "bench_results"
+FIXTURE_DIR = RESULTS_DIR / "fixtures"
+BASELINE_FILE = RESULTS_DIR / "baseline.json"
+
+BENCH_MYSQL_DB = os.getenv("BENCH_MYSQL_DB", "inventory_bench")
+DEFAULT_SCALES = "10k,100k,1m"
+# fail when rows/sec falls this fraction below the baseline
+DEFAULT_THRESHOLD = 0.2
+# synthetic items per movement
+ITEMS_PER_MOVEMENT = 1 / 20
+
+
+def parse_scale(text):
+    text = text.strip().lower()
+    mult = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+
+def fixture_for(movements):
+    """Synthetic fixture for `movements` voucher lines, generated once and reused."""
+    from tally_fixture import synthesize
+    FIXTURE_DIR.mkdir(parents=True, exist_ok=True)
+    path = FIXTURE_DIR / f"tally_{movements}.jsonl.gz"
+    if not path.exists():
+        logging.info("Generating fixture %s", path)
+        synthesize(str(path), max(100, int(movements * ITEMS_PER_MOVEMENT)), movements)
+    return str(path)
+
+
+def _timed(stages, name, rows, fn):
+    """Run fn() as stage `name`. `rows` may be a callable of fn's result."""
+    from pipeline import peak_rss_mb
+    t0 = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t0
+    if callable(rows):
+        rows = rows(result)
+    stages[name] = {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return result
+
+
+def _mysql_cfg():
+    return {
+        "host": os.getenv("MYSQL_HOST", "localhost"),
+        "user": os.getenv("MYSQL_USER", "root"),
+        "password": os.getenv("MYSQL_PASSWORD", ""),
+        "port": int(os.getenv("MYSQL_PORT", 3306)),
+    }
+
+
+def prepare_mysql():
+    """Create an empty bench database. Returns None, or why MySQL is skipped."""
+    if BENCH_MYSQL_DB == os.getenv("MYSQL_DB", "inventory_db"):
+        return f"BENCH_MYSQL_DB ({BENCH_MYSQL_DB}) is the live database"
+    try:
+        import mysql.connector
+        conn = mysql.connector.connect(connection_timeout=3, **_mysql_cfg())
+    except Exception as e:
+        return f"MySQL not reachable: {e}"
+    cur = conn.cursor()
+    cur.execute(f"DROP DATABASE IF EXISTS `{BENCH_MYSQL_DB}`")
+    cur.execute(f"CREATE DATABASE `{BENCH_MYSQL_DB}`")
+    conn.close()
+    return None
+
+
+# -------------------------
+# WORKERS (one fresh process per scale/target)
+# -------------------------
+def run_etl_bench(target, fixture, workdir):
+    import pipeline
+    pipeline.SQLITE_DB = Path(workdir) / "bench.db"
+    etl = pipeline.ETLPipeline(target=target, fixture=fixture, load_method=os.getenv("ETL_LOAD_METHOD", "infile"))
+    etl.mysql_cfg["database"] = BENCH_MYSQL_DB
+
+    stages = {}
+    _timed(stages, "etl_extract", lambda _: len(etl.items) + len(etl.movements), etl.extract)
+    rows = stages["etl_extract"]["rows"]
+    _timed(stages, "etl_transform", rows, etl.transform)
+    _timed(stages, "etl_load", rows, etl.load)
+    # same fixture again: every movement is already there
+    _timed(stages, "etl_reload", rows, etl.load)
+    return stages
+
+
+def run_sync_bench(fixture):
+    os.environ["TALLY_FIXTURE"] = fixture
+    os.environ["MYSQL_DB"] = BENCH_MYSQL_DB
+    os.environ.pop("TALLY_RECORD", None)
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import app
+
+    stages = {}
+    for mode in ("full", "incremental"):
+        result = _timed(stages, f"sync_{mode}", lambda r: r.get("items", 0) + r.get("movements", 0),
+                        lambda: app.sync_from_tally(mode=mode))
+        if not result.get("ok"):
+            raise RuntimeError(f"sync_from_tally({mode}) failed: {result.get('error')}")
+        st = stages[f"sync_{mode}"]
+        st["timings"] = {k: v for k, v in result["timings"].items() if not isinstance(v, dict)}
+    return stages
+
+
+LOADER_TABLES = ("companies", "product_companies", "sales_product_company", "sales_items")
+
+
+def run_loader_bench(fixture):
+    import load_to_mysql
+    import tally_fixture
+    load_to_mysql.DB_NAME = BENCH_MYSQL_DB
+    conn = load_to_mysql.get_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM information_schema.TABLES WHERE TABLE_SCHEMA=%s AND TABLE_NAME IN %s",
+                    (BENCH_MYSQL_DB, LOADER_TABLES))
+        present = cur.fetchone()["n"]
+    conn.close()
+    if present != len(LOADER_TABLES):
+        return {"skipped": f"loader tables {', '.join(LOADER_TABLES)} are not in schema.sql"}
+
+    # sales per party (company) and brand (product company) from the synthetic movements
+    brands = {r["name"]: r["category"] for r in tally_fixture.iter_gateway(fixture, "stock_items")}
+    sales = {}
+    for m in tally_fixture.iter_gateway(fixture, "stock_movements"):
+        if m["movement_type"] != "OUT":
+            continue
+        by_brand = sales.setdefault(m["company"], {})
+        ps = by_brand.setdefault(brands.get(m["item"], "Unknown"), {"sales_amount": 0.0, "items": {}})
+        ps["sales_amount"] += m["amount"]
+        item = ps["items"].setdefault(m["item"], {"item_name": m["item"], "quantity": 0.0, "sales_amount": 0.0})
+        item["quantity"] += m["qty"]
+        item["sales_amount"] += m["amount"]
+    sales_data_map = {
+        party: [{"product_company": brand, "sales_amount": ps["sales_amount"], "items": list(ps["items"].values())}
+                for brand, ps in by_brand.items()]
+        for party, by_brand in sales.items()
+    }
+    companies = [{"name": party} for party in sales_data_map]
+    rows = sum(len(i["items"]) for ps in sales_data_map.values() for i in ps)
+
+    stages = {}
+    _timed(stages, "loader_run", rows, lambda: load_to_mysql.run_loader(companies, {}, sales_data_map))
+    return stages
+
+
+def run_job(job):
+    """Entry point of a worker process. Returns (job, stages or {"error"/"skipped": ...})."""
+    logging.basicConfig(level=logging.WARNING)
+    kind, target, fixture = job["kind"], job["target"], job["fixture"]
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            if kind == "etl":
+                return job, run_etl_bench(target, fixture, workdir)
+            if kind == "sync":
+                return job, run_sync_bench(fixture)
+            return job, run_loader_bench(fixture)
+    except Exception as e:
+        return job, {"error": f"{type(e).__name__}: {e}"}
+
+
+def run_in_fresh_process(job):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as ex:
+        return ex.submit(run_job, job).result()
+
+
+# -------------------------
+# REPORTING
+# -------------------------
+def compare(results, baseline, threshold):
+    """Return [(key, stage, baseline rows/s, current rows/s)] for stages slower than allowed."""
+    regressions = []
+    for key, stages in results["runs"].items():
+        base_stages = baseline.get("runs", {}).get(key, {})
+        for stage, st in stages.items():
+            base = base_stages.get(stage)
+            if not isinstance(st, dict) or not isinstance(base, dict):
+                continue
+            now_rps, base_rps = st.get("rows_per_sec"), base.get("rows_per_sec")
+            if now_rps and base_rps and now_rps < base_rps * (1 - threshold):
+                regressions.append((key, stage, base_rps, now_rps))
+    return regressions
+
+
+def print_report(results):
+    print(f"{'run':<22} {'stage':<16} {'rows':>9} {'seconds':>9} {'rows/s':>11} {'rss_mb':>8}")
+    for key, stages in results["runs"].items():
+        if "skipped" in stages or "error" in stages:
+            print(f"{key:<22} {stages.get('skipped') or 'ERROR ' + stages['error']}")
+            continue
+        for stage, st in stages.items():
+            print(f"{key:<22} {stage:<16} {st['rows']:>9} {st['seconds']:>9.3f} "
+                  f"{st['rows_per_sec'] or 0:>11.1f} {st['peak_rss_mb'] or 0:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ETL pipeline, loader and Tally sync")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help=f"comma-separated movement counts, e.g. 10k,100k,1m (default {DEFAULT_SCALES})")
+    parser.add_argument("--targets", default="sqlite,mysql", help="sqlite, mysql or both")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed rows/sec drop vs baseline (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--save-baseline", action="store_true", help=f"also write results to {BASELINE_FILE}")
+    parser.add_argument("--output", default=None, help="results file (default bench_results/<timestamp>.json)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    results = {"started_at": datetime.datetime.now().isoformat(timespec="seconds"), "skipped": {}, "runs": {}}
+    for movements in (parse_scale(s) for s in args.scales.split(",")):
+        fixture = fixture_for(movements)
+        jobs = []
+        if "sqlite" in targets:
+            jobs.append({"kind": "etl", "target": "sqlite"})
+        if "mysql" in targets:
+            skip = prepare_mysql()
+            if skip:
+                results["skipped"][f"mysql/{movements}"] = skip
+                logging.warning("Skipping MySQL at %d movements: %s", movements, skip)
+            else:
+                jobs += [{"kind": "etl", "target": "mysql"}, {"kind": "sync", "target": "mysql"},
+                         {"kind": "loader", "target": "mysql"}]
+        for job in jobs:
+            job.update(fixture=fixture, movements=movements)
+            key = f"{job['kind']}/{job['target']}/{movements}"
+            logging.info("Running %s", key)
+            _, stages = run_in_fresh_process(job)
+            results["runs"][key] = stages
+
+    print_report(results)
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = Path(args.output) if args.output else RESULTS_DIR / f"{results['started_at'].replace(':', '')}.json"
+    out.write_text(json.dumps(results, indent=2))
+    logging.info("Results written to %s", out)
+    if args.save_baseline:
+        BASELINE_FILE.write_text(json.dumps(results, indent=2))
+        logging.info("Baseline updated: %s", BASELINE_FILE)
+
+    failed = [k for k, st in results["runs"].items() if "error" in st]
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        for key, stage, base, now in regressions:
+            print(f"REGRESSION {key} {stage}: {base} -> {now} rows/s")
+        if regressions:
+            failed.append("regressions")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
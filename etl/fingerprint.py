@@ -0,0 +1,66 @@
+"""
+Content fingerprints for Tally rows.
+
+Shared by app.sync_from_tally() and the ETL loaders so that a row hashed from
+the gateway JSON, from ODBC or read back from MySQL always gets the same key.
+"""
+
+import datetime
+import decimal
+import hashlib
+
+ITEM_FIELDS = ("name", "category", "base_unit", "opening_qty", "opening_rate")
+MOVEMENT_FIELDS = ("date", "voucher_no", "company", "item", "qty", "rate", "amount", "movement_type")
+
+_NUMERIC = {"opening_qty", "opening_rate", "qty", "rate", "amount"}
+
+
+def _norm(field, value):
+    if value is None or value == "":
+        return ""
+    if field in _NUMERIC:
+        try:
+            return f"{float(value):.4f}"
+        except (TypeError, ValueError):
+            return str(value).strip()
+    if field == "date":
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()[:10]
+        return str(value).strip()[:10]
+    if isinstance(value, decimal.Decimal):
+        return f"{float(value):.4f}"
+    return str(value).strip()
+
+
+def _digest(parts):
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def item_fingerprint(values):
+    """Hash of a stock item, given as a dict or a tuple in ITEM_FIELDS order."""
+    if isinstance(values, dict):
+        values = [values.get(f) for f in ITEM_FIELDS]
+    return _digest([_norm(f, v) for f, v in zip(ITEM_FIELDS, values)])
+
+
+def movement_hashes(movements, seen=None):
+    """
+    Return one hash per movement (dicts or tuples in MOVEMENT_FIELDS order).
+
+    Movements have no natural key in Tally, so the hash covers all identifying
+    fields plus an occurrence number: two identical voucher lines get distinct,
+    but still deterministic, hashes. Pass the same `seen` dict for every batch
+    when hashing a stream, so occurrence numbers continue across batches.
+    """
+    if seen is None:
+        seen = {}
+    out = []
+    for m in movements:
+        if isinstance(m, dict):
+            m = [m.get(f) for f in MOVEMENT_FIELDS]
+        parts = [_norm(f, v) for f, v in zip(MOVEMENT_FIELDS, m)]
+        base = _digest(parts)
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        out.append(_digest(parts + [str(n)]))
+    return out
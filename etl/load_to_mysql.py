@@ -1,7 +1,13 @@
 import os
+import logging
 import pymysql
 from dotenv import load_dotenv
 
+try:
+    from .availability import item_key
+except ImportError:  # run as a script from etl/
+    from availability import item_key
+
 load_dotenv()
 
 # Use MYSQL_* env vars or fall back to DB_*
@@ -11,6 +17,9 @@ DB_USER = os.getenv("MYSQL_USER", os.getenv("DB_USER", "root"))
 DB_PASS = os.getenv("MYSQL_PASSWORD", os.getenv("DB_PASS", ""))
 DB_NAME = os.getenv("MYSQL_DB", os.getenv("DB_NAME", "inventory_db"))
 
+# Max values per IN (...) list
+IN_CHUNK_SIZE = int(os.getenv("LOADER_IN_CHUNK_SIZE", 1000))
+
 def get_connection():
     """Return a MySQL connection using environment variables."""
     return pymysql.connect(
@@ -22,7 +31,71 @@ def get_connection():
         cursorclass=pymysql.cursors.DictCursor
     )
 
-def upsert_company(conn, name):
+def _chunks(seq, size=IN_CHUNK_SIZE):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+class KeyCache:
+    """
+    In-process name -> id cache for a dimension table (companies,
+    product_companies). warm() loads the whole table with one SELECT, and
+    resolve() inserts every miss with one multi-row INSERT before reading the
+    new ids back with an IN lookup. Ids are only valid inside the transaction
+    that created them, so a cache lives for one run_loader() call.
+    Entries are keyed by item_key(), matching how MySQL compares the names.
+    """
+
+    def __init__(self, table):
+        if table not in ("companies", "product_companies"):
+            raise ValueError(f"No key cache for table {table}")
+        self.table = table
+        self.ids = {}
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT id, name FROM {self.table} ORDER BY id")
+            for r in cur.fetchall():
+                self.ids.setdefault(item_key(r["name"]), r["id"])
+        return self
+
+    def _lookup(self, cur, names):
+        for chunk in _chunks(names):
+            # pymysql renders a tuple as an IN list
+            cur.execute(f"SELECT id, name FROM {self.table} WHERE name IN %s ORDER BY id", (tuple(chunk),))
+            # the oldest row wins when duplicates already exist
+            for r in cur.fetchall():
+                self.ids.setdefault(item_key(r["name"]), r["id"])
+
+    def resolve(self, conn, names):
+        """Return {name: id} for all names, creating the missing rows in one batch."""
+        names = list(dict.fromkeys(n for n in names if n))
+        # one name per key: spellings MySQL considers equal must not be inserted twice
+        by_key = {}
+        for n in names:
+            by_key.setdefault(item_key(n), n)
+        missing = [k for k in by_key if k not in self.ids]
+        self.hits += len(by_key) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            with conn.cursor() as cur:
+                # not warmed, or rows added by someone else since
+                self._lookup(cur, [by_key[k] for k in missing])
+                missing = [k for k in missing if k not in self.ids]
+                if missing:
+                    # executemany collapses into a single multi-row INSERT
+                    cur.executemany(f"INSERT INTO {self.table} (name) VALUES (%s)", [(by_key[k],) for k in missing])
+                    self._lookup(cur, [by_key[k] for k in missing])
+        return {n: self.ids[item_key(n)] for n in names if item_key(n) in self.ids}
+
+    def get(self, conn, name):
+        return self.resolve(conn, [name]).get(name)
+
+def upsert_company(conn, name, cache=None):
+    if cache is not None:
+        return cache.get(conn, name)
     with conn.cursor() as cur:
         cur.execute("SELECT id FROM companies WHERE name=%s", (name,))
         row = cur.fetchone()
@@ -31,7 +104,9 @@ def upsert_company(conn, name):
         cur.execute("INSERT INTO companies (name) VALUES (%s)", (name,))
         return cur.lastrowid
 
-def upsert_product_company(conn, name):
+def upsert_product_company(conn, name, cache=None):
+    if cache is not None:
+        return cache.get(conn, name)
     with conn.cursor() as cur:
         cur.execute("SELECT id FROM product_companies WHERE name=%s", (name,))
         row = cur.fetchone()
@@ -62,44 +137,70 @@ def insert_stock_items(conn, company_id, stock_items):
         """, rows)
     logging.info("Inserted/updated %d stock items", len(rows))
 
-def insert_sales(conn, company_id, product_sales, brand_items_map):
+def insert_sales(conn, company_id, product_sales, brand_items_map, pc_cache=None):
+    """
+    Set-based load of one company's sales: resolve all brand ids at once
+    (through `pc_cache` when given), upsert every summary in one statement,
+    fetch their ids with one IN lookup, then replace the items of all
+    affected summaries with one DELETE and one insert.
+    """
+    # last entry per brand wins, as it did when brands were written one by one
+    sales_by_brand = {ps["product_company"]: ps for ps in product_sales}
+    if not sales_by_brand:
+        return
+    if pc_cache is None:
+        pc_cache = KeyCache("product_companies")
+    pc_ids = pc_cache.resolve(conn, sales_by_brand)
+
     with conn.cursor() as cur:
-        for ps in product_sales:
-            brand_name = ps["product_company"]
-            pc_id = upsert_product_company(conn, brand_name)
+        cur.executemany("""
+            INSERT INTO sales_product_company (company_id, product_company_id, total_sales)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE 
+                total_sales=VALUES(total_sales),
+                last_updated=CURRENT_TIMESTAMP
+        """, [(company_id, pc_ids[brand], ps["sales_amount"])
+              for brand, ps in sales_by_brand.items() if brand in pc_ids])
 
-            # Upsert summary row
+        spc_ids = {}
+        for chunk in _chunks(pc_ids.values()):
             cur.execute("""
-                INSERT INTO sales_product_company (company_id, product_company_id, total_sales)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE 
-                    total_sales=VALUES(total_sales),
-                    last_updated=CURRENT_TIMESTAMP
-            """, (company_id, pc_id, ps["sales_amount"]))
-
-            cur.execute("SELECT id FROM sales_product_company WHERE company_id=%s AND product_company_id=%s", (company_id, pc_id))
-            spc = cur.fetchone()
-            if not spc:
+                SELECT id, product_company_id FROM sales_product_company
+                WHERE company_id=%s AND product_company_id IN %s
+            """, (company_id, tuple(chunk)))
+            spc_ids.update({r["product_company_id"]: r["id"] for r in cur.fetchall()})
+        if not spc_ids:
+            return
+
+        # Reset old items and insert new
+        for chunk in _chunks(spc_ids.values()):
+            cur.execute("DELETE FROM sales_items WHERE sales_pc_id IN %s", (tuple(chunk),))
+        rows = []
+        for brand, pc_id in pc_ids.items():
+            sales_pc_id = spc_ids.get(pc_id)
+            if sales_pc_id is None:
                 continue
-            sales_pc_id = spc["id"]
-
-            # Reset old items and insert new
-            cur.execute("DELETE FROM sales_items WHERE sales_pc_id=%s", (sales_pc_id,))
-            items = brand_items_map.get(brand_name, [])
-            rows = [(sales_pc_id, i["item_name"], i.get("quantity", 0), i.get("sales_amount", 0)) for i in items]
-            if rows:
-                cur.executemany("""
-                    INSERT INTO sales_items (sales_pc_id, item_name, quantity, sales_amount)
-                    VALUES (%s, %s, %s, %s)
-                """, rows)
-    logging.info("Inserted/updated sales for %d brands", len(product_sales))
+            for i in brand_items_map.get(brand, []):
+                rows.append((sales_pc_id, i["item_name"], i.get("quantity", 0), i.get("sales_amount", 0)))
+        if rows:
+            cur.executemany("""
+                INSERT INTO sales_items (sales_pc_id, item_name, quantity, sales_amount)
+                VALUES (%s, %s, %s, %s)
+            """, rows)
+    logging.info("Inserted/updated sales for %d brands (%d items)", len(spc_ids), len(rows))
 
 def run_loader(companies_data, stock_data_map, sales_data_map):
     conn = get_connection()
     try:
+        # dimension ids for the whole run: one SELECT per table up front, then
+        # all companies resolved in one batch
+        company_cache = KeyCache("companies").warm(conn)
+        pc_cache = KeyCache("product_companies").warm(conn)
+        company_ids = company_cache.resolve(conn, [c["name"] for c in companies_data])
+
         for comp in companies_data:
             comp_name = comp["name"]
-            company_id = upsert_company(conn, comp_name)
+            company_id = company_ids.get(comp_name) or upsert_company(conn, comp_name)
 
             # Stock
             stock_items = stock_data_map.get(comp_name, [])
@@ -110,9 +211,11 @@ def run_loader(companies_data, stock_data_map, sales_data_map):
             product_sales = sales_data_map.get(comp_name, [])
             brand_items_map = {ps["product_company"]: ps.get("items", []) for ps in product_sales}
             if product_sales:
-                insert_sales(conn, company_id, product_sales, brand_items_map)
+                insert_sales(conn, company_id, product_sales, brand_items_map, pc_cache)
 
         conn.commit()
+        logging.info("Key cache: companies %d hits/%d misses, product companies %d hits/%d misses",
+                     company_cache.hits, company_cache.misses, pc_cache.hits, pc_cache.misses)
         logging.info("✅ All data committed successfully")
     except Exception as e:
         conn.rollback()
@@ -0,0 +1,200 @@
+"""
+Bulk-load helpers for MySQL (mysql-connector connections).
+
+Used by app.sync_from_tally() and ETLPipeline._load_mysql() for full reloads.
+"""
+
+import os
+import time
+import logging
+import tempfile
+
+SHADOW_SUFFIX = "__shadow"
+OLD_SUFFIX = "__old"
+INSERT_CHUNK_SIZE = 5000
+SWAP_LOCK_NAME = "inventory_shadow_swap"
+
+# "infile": LOAD DATA LOCAL INFILE from a temp TSV, falling back to executemany
+# when the server or connector refuses local infile; "executemany": chunked inserts
+LOAD_METHODS = ("infile", "executemany")
+# ER_NOT_ALLOWED_COMMAND, CR_LOAD_DATA_LOCAL_INFILE_REJECTED, ER_CLIENT_LOCAL_FILES_DISABLED
+LOCAL_INFILE_ERRNOS = {1148, 2068, 3948}
+
+
+def _secondary_indexes(cur, table):
+    """Return [(index_name, unique, [column sql, ...])] for non-primary indexes of `table`."""
+    cur.execute("""
+        SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME, SUB_PART
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME <> 'PRIMARY'
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (table,))
+    indexes = {}
+    for name, non_unique, column, sub_part in cur.fetchall():
+        col = f"`{column}`" + (f"({sub_part})" if sub_part else "")
+        idx = indexes.setdefault(name, [name, not int(non_unique), []])
+        idx[2].append(col)
+    return [tuple(v) for v in indexes.values()]
+
+
+def _insert_chunks(cur, table, columns, rows, chunk_size=INSERT_CHUNK_SIZE, ignore=False):
+    cols = ", ".join(f"`{c}`" for c in columns)
+    placeholders = ", ".join(["%s"] * len(columns))
+    sql = f"INSERT {'IGNORE ' if ignore else ''}INTO `{table}` ({cols}) VALUES ({placeholders})"
+    total = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        cur.executemany(sql, chunk)
+        # with IGNORE, rows skipped on a duplicate key are not affected rows
+        total += cur.rowcount if ignore else len(chunk)
+    return total
+
+
+def _tsv_field(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(value)
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def load_data_infile(cur, table, columns, rows, ignore=False):
+    """
+    Write rows to a temporary TSV file and load it with LOAD DATA LOCAL INFILE.
+    Returns the number of rows inserted (duplicates skipped with `ignore`).
+    """
+    fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=".tsv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+            for row in rows:
+                f.write("\t".join(_tsv_field(v) for v in row))
+                f.write("\n")
+        cols = ", ".join(f"`{c}`" for c in columns)
+        cur.execute(
+            f"LOAD DATA LOCAL INFILE %s {'IGNORE ' if ignore else ''}INTO TABLE `{table}` CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({cols})",
+            (path.replace("\\", "/"),))
+        return cur.rowcount
+    finally:
+        os.remove(path)
+
+
+def bulk_insert(cur, table, columns, rows, method="infile", chunk_size=INSERT_CHUNK_SIZE, ignore=False):
+    """
+    Append rows to `table` with the selected method. "infile" falls back to
+    chunked executemany when local infile is disabled on either side.
+    With `ignore`, rows that hit a unique key already present are skipped, so
+    a retried load does not duplicate them. Returns the number of rows loaded.
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"Unknown load method {method}")
+    if not rows:
+        return 0
+    if method == "infile":
+        try:
+            n = load_data_infile(cur, table, columns, rows, ignore=ignore)
+            return n if ignore else len(rows)
+        except Exception as e:
+            if getattr(e, "errno", None) not in LOCAL_INFILE_ERRNOS:
+                raise
+            logging.warning("LOAD DATA LOCAL INFILE not allowed (%s); falling back to executemany", e)
+    return _insert_chunks(cur, table, columns, rows, chunk_size, ignore=ignore)
+
+
+def benchmark_load_methods(conn, table, columns, rows, methods=LOAD_METHODS):
+    """
+    Load the same rows into a scratch copy of `table` with each method and
+    return {method: {"rows", "seconds", "rows_per_sec"}}. Live data is untouched.
+    """
+    scratch = f"{table}__bench"
+    cur = conn.cursor()
+    results = {}
+    try:
+        for method in methods:
+            cur.execute(f"DROP TABLE IF EXISTS `{scratch}`")
+            cur.execute(f"CREATE TABLE `{scratch}` LIKE `{table}`")
+            t0 = time.perf_counter()
+            n = bulk_insert(cur, scratch, columns, rows, method=method)
+            conn.commit()
+            seconds = time.perf_counter() - t0
+            results[method] = {"rows": n, "seconds": round(seconds, 3),
+                               "rows_per_sec": round(n / seconds, 1) if seconds else None}
+            logging.info("load benchmark %s: %s", method, results[method])
+    finally:
+        cur.execute(f"DROP TABLE IF EXISTS `{scratch}`")
+        cur.close()
+    return results
+
+
+def shadow_swap_load(conn, tables, lock_timeout=60, loader=None):
+    """
+    Full reload without ever exposing an empty or half-loaded table.
+
+    `tables` is a list of (table, columns, rows). For each table a staging copy
+    `<table>__shadow` is created LIKE the live table, its secondary indexes are
+    dropped, the rows are bulk-inserted and the indexes are rebuilt in one
+    ALTER. All live tables are then replaced with a single atomic RENAME TABLE
+    and the previous copies dropped.
+
+    `loader(cur, table, columns, rows)` may replace the default chunked
+    executemany insert. Returns {table: rows loaded}.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, %s)", (SWAP_LOCK_NAME, lock_timeout))
+    if cur.fetchone()[0] != 1:
+        cur.close()
+        raise RuntimeError("Another full reload is already running")
+    loaded = {}
+    try:
+        for table, columns, rows in tables:
+            shadow = table + SHADOW_SUFFIX
+            cur.execute(f"DROP TABLE IF EXISTS `{shadow}`")
+            cur.execute(f"CREATE TABLE `{shadow}` LIKE `{table}`")
+
+            indexes = _secondary_indexes(cur, shadow)
+            if indexes:
+                drops = ", ".join(f"DROP INDEX `{name}`" for name, _, _ in indexes)
+                cur.execute(f"ALTER TABLE `{shadow}` {drops}")
+
+            if loader is not None:
+                loaded[table] = loader(cur, shadow, columns, rows)
+            else:
+                loaded[table] = _insert_chunks(cur, shadow, columns, rows)
+            conn.commit()
+
+            if indexes:
+                adds = ", ".join(
+                    f"ADD {'UNIQUE ' if unique else ''}INDEX `{name}` ({', '.join(cols)})"
+                    for name, unique, cols in indexes
+                )
+                cur.execute(f"ALTER TABLE `{shadow}` {adds}")
+            logging.info("Staged %d rows into %s", loaded[table], shadow)
+
+        renames = []
+        for table, _, _ in tables:
+            cur.execute(f"DROP TABLE IF EXISTS `{table}{OLD_SUFFIX}`")
+            renames.append(f"`{table}` TO `{table}{OLD_SUFFIX}`")
+            renames.append(f"`{table}{SHADOW_SUFFIX}` TO `{table}`")
+        cur.execute("RENAME TABLE " + ", ".join(renames))
+        for table, _, _ in tables:
+            cur.execute(f"DROP TABLE IF EXISTS `{table}{OLD_SUFFIX}`")
+        logging.info("Swapped in new copies of %s", ", ".join(t for t, _, _ in tables))
+        return loaded
+    except Exception:
+        conn.rollback()
+        for table, _, _ in tables:
+            try:
+                cur.execute(f"DROP TABLE IF EXISTS `{table}{SHADOW_SUFFIX}`")
+            except Exception:
+                logging.exception("Could not drop staging table for %s", table)
+        raise
+    finally:
+        try:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (SWAP_LOCK_NAME,))
+            cur.fetchall()
+        except Exception:
+            pass
+        cur.close()
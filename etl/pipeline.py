@@ -3,9 +3,12 @@ ETL pipeline for Tally -> MySQL (denormalized: company/item as strings).
 """
 
 import os
+import sys
+import time
 import logging
 import datetime
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -14,6 +17,24 @@ try:
 except ImportError:
     mysql = None
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from .mysql_bulk import shadow_swap_load, bulk_insert, benchmark_load_methods, LOAD_METHODS, SHADOW_SUFFIX
+    from .fingerprint import movement_hashes
+    from .availability import refresh_availability
+    from . import telemetry
+    from . import tally_fixture
+except ImportError:  # run as a script from etl/
+    from mysql_bulk import shadow_swap_load, bulk_insert, benchmark_load_methods, LOAD_METHODS, SHADOW_SUFFIX
+    from fingerprint import movement_hashes
+    from availability import refresh_availability
+    import telemetry
+    import tally_fixture
+
 load_dotenv()
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -25,11 +46,175 @@ logging.basicConfig(
 )
 
 
+def normalize_name(name):
+    """Key used to match item names across Tally tables: trimmed, single-spaced, case-folded."""
+    return " ".join(str(name).split()).casefold() if name else ""
+
+
+class ItemIndex:
+    """
+    Stock item dimension keyed by normalized name, built once after the
+    StockItem fetch and shared by movement enrichment and transform.
+    Later duplicates win, matching the transform dedup.
+    """
+
+    def __init__(self, items=()):
+        self._by_name = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        key = normalize_name(item.get("name"))
+        if key:
+            self._by_name[key] = item
+
+    def get(self, name):
+        return self._by_name.get(normalize_name(name))
+
+    def category(self, name, default=None):
+        item = self.get(name)
+        return item.get("category") or default if item else default
+
+    def base_unit(self, name, default=None):
+        item = self.get(name)
+        return item.get("base_unit") or default if item else default
+
+    def rate(self, name, default=0.0):
+        item = self.get(name)
+        return item.get("opening_rate") or default if item else default
+
+    def items(self):
+        return list(self._by_name.values())
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __contains__(self, name):
+        return normalize_name(name) in self._by_name
+
+
+# etl_state row holding the movement watermark (last loaded voucher date)
+MOVEMENTS_WATERMARK = "stock_movements"
+
+# Rows per fetchmany / executemany batch in streaming mode
+CHUNK_SIZE = int(os.getenv("ETL_CHUNK_SIZE", 5000))
+# Source queries run at once in parallel extract mode (one ODBC connection each)
+EXTRACT_WORKERS = int(os.getenv("ETL_EXTRACT_WORKERS", 3))
+# How movement rows reach MySQL: "infile" (LOAD DATA LOCAL INFILE, falls back
+# to executemany if refused) or "executemany"
+LOAD_METHOD = os.getenv("ETL_LOAD_METHOD", "infile")
+
+# movement_hash (unique) makes movement loads idempotent: re-running or retrying
+# a load skips rows that are already there instead of duplicating them
+MOVEMENT_COLUMNS = ("date", "voucher_no", "company", "item", "qty", "rate", "amount",
+                    "movement_type", "movement_hash")
+ITEM_COLUMNS = ("name", "category", "base_unit", "opening_qty", "opening_rate")
+
+ITEMS_QUERY = """
+    SELECT $Name, $Parent, $BaseUnits, $_ClosingBalance, $_ClosingRate
+    FROM StockItem
+"""
+LEDGERS_QUERY = "SELECT $Name FROM Ledger"
+MOVEMENTS_QUERY = """
+    SELECT $_LastSaleDate, $_LastSaleParty,$StockItemName, $_LastSalePrice,
+   $_OutwardQuantity, $_OutwardValue
+    FROM VchStockItem
+"""
+
+ITEM_UPSERT_SQL = """INSERT INTO stock_items
+    (name,category,base_unit,opening_qty,opening_rate)
+    VALUES (%s,%s,%s,%s,%s)
+    ON DUPLICATE KEY UPDATE
+        category=VALUES(category),
+        base_unit=VALUES(base_unit),
+        opening_qty=VALUES(opening_qty),
+        opening_rate=VALUES(opening_rate)"""
+
+
+# SQLite offline copy. schema.sql is MySQL DDL, so SQLite gets its own.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS etl_state (
+    id TEXT PRIMARY KEY,
+    last_sync TEXT
+);
+CREATE TABLE IF NOT EXISTS stock_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE,
+    category TEXT,
+    base_unit TEXT,
+    opening_qty REAL,
+    opening_rate REAL
+);
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT,
+    voucher_no TEXT,
+    company TEXT,
+    item TEXT,
+    qty REAL,
+    rate REAL,
+    amount REAL,
+    movement_type TEXT,
+    movement_hash TEXT,
+    source TEXT DEFAULT 'tally'
+);
+"""
+# needed by INSERT OR IGNORE during the load, so never dropped for it
+SQLITE_MOVEMENT_HASH_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS ux_movements_hash ON stock_movements (movement_hash)"
+SQLITE_MOVEMENT_INDEXES = [
+    ("idx_movements_item_date", "CREATE INDEX IF NOT EXISTS idx_movements_item_date ON stock_movements (item, date)"),
+    ("idx_movements_type_company", "CREATE INDEX IF NOT EXISTS idx_movements_type_company ON stock_movements (movement_type, company)"),
+]
+SQLITE_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-200000",   # ~200 MB page cache
+    "PRAGMA temp_store=MEMORY",
+]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported, e.g. Windows)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def row_bytes(rows):
+    """Approximate payload size of ODBC rows (text length of all non-null values)."""
+    return sum(len(str(v)) for r in rows for v in r if v is not None)
+
+
 class ETLPipeline:
-    def __init__(self, target="mysql"):
+    def __init__(self, target="mysql", incremental=False, chunk_size=CHUNK_SIZE,
+                 parallel=False, extract_workers=EXTRACT_WORKERS, load_method=LOAD_METHOD,
+                 fixture=None, record=None):
+        if load_method not in LOAD_METHODS:
+            raise ValueError(f"load_method must be one of {LOAD_METHODS}")
         self.target = target
+        self.load_method = load_method
+        # fixture: replay a recorded/synthetic Tally file instead of ODBC;
+        # record: save everything read from Tally to that file (tally_fixture.py)
+        self.fixture = fixture or os.getenv("TALLY_FIXTURE") or None
+        self.record = record or os.getenv("TALLY_RECORD") or None
+        self._recorder = tally_fixture.Recorder() if self.record else None
+        self.chunk_size = chunk_size
+        # parallel: run the independent source queries on separate connections
+        self.parallel = parallel
+        self.extract_workers = extract_workers
+        self.extract_timings = {}
+        self.load_stats = {}
+        # per-stage {"rows", "seconds"[, "bytes"]}, recorded in etl_runs by run()
+        self.stages = {}
+        # incremental: only extract/load movements dated on or after the
+        # watermark persisted in etl_state by the last successful load
+        self.incremental = incremental
+        self.since = None
         self.companies = []
         self.items = []
+        self.item_index = ItemIndex()
         self.movements = []
 
         self.mysql_cfg = {
@@ -38,17 +223,86 @@ class ETLPipeline:
             "password": os.getenv("MYSQL_PASSWORD", ""),
             "database": os.getenv("MYSQL_DB", "inventory_db"),
             "port": int(os.getenv("MYSQL_PORT", 3306)),
+            # LOAD DATA LOCAL INFILE is refused client-side unless enabled
+            "allow_local_infile": load_method == "infile",
         }
 
     # -------------------------
     # EXTRACT
     # -------------------------
+    def run(self, reset=False, stream=False, chunk_size=None):
+        """
+        Extract, transform and load (or run_streaming() with `stream`), and
+        record the run with its stage timings and outcome via telemetry.
+        """
+        mode = "stream" if stream else "reset" if reset else "incremental" if self.incremental else "full"
+        run = telemetry.new_run(self.target, mode)
+        self.stages = {}
+        outcome, error = "ok", None
+        try:
+            if stream:
+                self.stages = self.run_streaming(chunk_size=chunk_size)["stages"]
+            else:
+                self.extract()
+                self.transform()
+                self.load(reset=reset)
+        except Exception as e:
+            outcome, error = "failed", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            telemetry.finish_run(run, self.stages, outcome, error, peak_rss_mb())
+            self._save_run(run)
+        return run
+
+    def _save_run(self, run):
+        # telemetry must never turn a good run into a failed one
+        try:
+            if self.target == "sqlite":
+                telemetry.save_run_file(run)
+            else:
+                conn = mysql.connect(**self.mysql_cfg)
+                try:
+                    self._apply_mysql_schema(conn.cursor())
+                    telemetry.save_run_mysql(conn, run)
+                finally:
+                    conn.close()
+            logging.info("Recorded ETL run: %s in %.1fs, %s rows/s",
+                         run["outcome"], run["total_seconds"], run["rows_per_sec"])
+        except Exception as e:
+            logging.warning("Could not record ETL run telemetry: %s", e)
+
+    def recent_runs(self, n=10):
+        """Last `n` recorded runs for this target, oldest first."""
+        if self.target == "sqlite":
+            return telemetry.recent_runs_file(n)
+        conn = mysql.connect(**self.mysql_cfg)
+        try:
+            return telemetry.recent_runs_mysql(conn, n)
+        finally:
+            conn.close()
+
+    def _add_stage(self, name, rows=0, seconds=0.0, nbytes=None):
+        st = self.stages.setdefault(name, {"rows": 0, "seconds": 0.0})
+        st["rows"] += rows
+        st["seconds"] += seconds
+        if nbytes is not None:
+            st["bytes"] = st.get("bytes", 0) + nbytes
+
     def extract(self):
         logging.info("🚀 Starting ETL process")
-        self._extract_live()
+        if self.incremental:
+            self.since = self._read_watermark()
+            logging.info("Incremental extract: movements since %s", self.since or "the beginning")
+        t0 = time.perf_counter()
+        if self.parallel:
+            self._extract_parallel()
+        else:
+            self._extract_live()
+        self.extract_timings["total"] = round(time.perf_counter() - t0, 3)
+        self._save_recording()
         logging.info(
-            "Extract complete: companies=%d items=%d movements=%d",
-            len(self.companies), len(self.items), len(self.movements)
+            "Extract complete: companies=%d items=%d movements=%d timings=%s",
+            len(self.companies), len(self.items), len(self.movements), self.extract_timings
         )
 
     def _safe_date(self, val):
@@ -58,92 +312,182 @@ class ETLPipeline:
             return datetime.date.today().isoformat()
         return str(val)[:10]
 
-    def _extract_live(self):
+    def _item_from_row(self, r):
+        return {
+            "name": str(r[0]).strip() if r[0] else "Unknown Item",
+            "category": str(r[1]).strip() if r[1] else None,
+            "base_unit": str(r[2]).strip() if r[2] else None,
+            "opening_qty": float(r[3]) if r[3] else 0.0,
+            "opening_rate": float(r[4]) if r[4] else 0.0,
+        }
+
+    def _movement_from_row(self, r):
+        """Enriched movement dict for a VchStockItem row; None if skipped or unparsable."""
+        # Skip header rows like ('Date','Voucher Number',...)
+        #if str(r[0]).upper() == "DATE" or str(r[4]).upper() == "ACTUAL QTY":
+         #   return None
+        try:
+            date_val = self._safe_date(r[0])
+            if self.since and date_val < self.since:
+                return None
+            #ledger = str(r[1]).strip() if r[1] else "Unknown"
+            party=str(r[1]).strip() if r[1] else "Unknown"
+            item_name=str(r[2]).strip() if r[2] else "Unknown Item"
+            rate = float(r[3]) if r[3] not in (None, "") else 0.0
+            qty = float(r[4]) if r[4] not in (None, "", "Actual Qty") else 0.0
+            amount = float(r[5]) if r[5] not in (None, "") else qty * rate
+
+            brand = self.item_index.category(item_name, "Unknown")
+
+            return {
+                "date": date_val,
+                "voucher_no": None,
+                "company": brand,
+                "item": item_name,
+                "qty": qty,
+                "rate": rate,
+                "amount": amount,
+                "movement_type": "OUT" if amount > 0 else "IN"
+            }
+        except Exception as e:
+            logging.error("Bad VchStockItem row: %s | error: %s", r, e)
+            return None
+
+    def _connect_source(self):
+        if self.fixture:
+            logging.info("Replaying Tally fixture %s", self.fixture)
+            return tally_fixture.connect(self.fixture)
         import pyodbc
         DSN = os.getenv("TALLY_DSN", "TallyODBC64_9000")
-        logging.info("Starting live extract from Tally ODBC (DSN=%s)", DSN)
+        logging.info("Connecting to Tally ODBC (DSN=%s)", DSN)
         conn = pyodbc.connect(f"DSN={DSN}")
+        return self._recorder.wrap(conn) if self._recorder else conn
+
+    def _save_recording(self):
+        if self._recorder:
+            self._recorder.save(self.record)
+            logging.info("Recorded Tally rows to %s", self.record)
+
+    def _timed_fetchall(self, cur, name, query):
+        t0 = time.perf_counter()
+        rows = cur.execute(query).fetchall()
+        seconds = time.perf_counter() - t0
+        self.extract_timings[name] = round(seconds, 3)
+        self._add_stage(f"extract_{name}", len(rows), seconds, row_bytes(rows))
+        return rows
+
+    def _build_items(self, rows):
+        self.items = [self._item_from_row(r) for r in rows]
+        self.item_index = ItemIndex(self.items)
+        logging.info("Fetched %d stock items", len(self.items))
+
+    def _build_companies(self, rows):
+        self.companies = [{"name": r[0].strip()} for r in rows if r[0]]
+        logging.info("Fetched %d ledgers", len(self.companies))
+
+    def _build_movements(self, rows):
+        self.movements = []
+        for r in rows:
+            m = self._movement_from_row(r)
+            if m is not None:
+                self.movements.append(m)
+        logging.info("Fetched %d voucher stock movements", len(self.movements))
+
+    def _extract_live(self):
+        logging.info("Starting live extract from Tally ODBC")
+        conn = self._connect_source()
         cur = conn.cursor()
 
         # --- Stock Items ---
         try:
-            rows = cur.execute("""
-                SELECT $Name, $Parent, $BaseUnits, $_ClosingBalance, $_ClosingRate
-                FROM StockItem
-            """).fetchall()
-            self.items = []
-            for r in rows:
-                self.items.append({
-                    "name": str(r[0]).strip() if r[0] else "Unknown Item",
-                    "category": str(r[1]).strip() if r[1] else None,
-                    "base_unit": str(r[2]).strip() if r[2] else None,
-                    "opening_qty": float(r[3]) if r[3] else 0.0,
-                    "opening_rate": float(r[4]) if r[4] else 0.0,
-                })
-            logging.info("Fetched %d stock items", len(self.items))
+            self._build_items(self._timed_fetchall(cur, "StockItem", ITEMS_QUERY))
         except Exception as e:
             logging.error("StockItem query failed: %s", e)
+            self.item_index = ItemIndex(self.items)
 
         # --- Ledgers ---
         try:
-            rows = cur.execute("SELECT $Name FROM Ledger").fetchall()
-            self.companies = [{"name": r[0].strip()} for r in rows if r[0]]
-            logging.info("Fetched %d ledgers", len(self.companies))
+            self._build_companies(self._timed_fetchall(cur, "Ledger", LEDGERS_QUERY))
         except Exception as e:
             logging.error("Ledger query failed: %s", e)
 
         # --- Voucher Movements ---
         try:
-            rows = cur.execute("""
-                SELECT $_LastSaleDate, $_LastSaleParty,$StockItemName, $_LastSalePrice,
-               $_OutwardQuantity, $_OutwardValue
-                FROM VchStockItem
-            """).fetchall()
-
-            self.movements = []
-            for r in rows:
-                # Skip header rows like ('Date','Voucher Number',...)
-                #if str(r[0]).upper() == "DATE" or str(r[4]).upper() == "ACTUAL QTY":
-                 #   continue
+            self._build_movements(self._timed_fetchall(cur, "VchStockItem", MOVEMENTS_QUERY))
+        except Exception as e:
+            logging.error("VchStockItem query failed: %s", e)
 
+        conn.close()
+
+    def _fetch_on_own_connection(self, name, query):
+        conn = self._connect_source()
+        try:
+            return self._timed_fetchall(conn.cursor(), name, query)
+        finally:
+            conn.close()
+
+    def _extract_parallel(self):
+        """
+        Run the StockItem, Ledger and VchStockItem queries concurrently, each on
+        its own ODBC connection (at most `extract_workers` at a time), then join:
+        movements are enriched once the item index is built.
+        """
+        logging.info("Starting parallel extract from Tally ODBC (workers=%d)", self.extract_workers)
+        queries = {"StockItem": ITEMS_QUERY, "Ledger": LEDGERS_QUERY, "VchStockItem": MOVEMENTS_QUERY}
+        with ThreadPoolExecutor(max_workers=self.extract_workers) as ex:
+            futures = {name: ex.submit(self._fetch_on_own_connection, name, q) for name, q in queries.items()}
+            results = {}
+            for name, fut in futures.items():
                 try:
-                    date_val = self._safe_date(r[0])
-                    #ledger = str(r[1]).strip() if r[1] else "Unknown"
-                    party=str(r[1]).strip() if r[1] else "Unknown"
-                    item_name=str(r[2]).strip() if r[2] else "Unknown Item"
-                    rate = float(r[3]) if r[3] not in (None, "") else 0.0
-                    qty = float(r[4]) if r[4] not in (None, "", "Actual Qty") else 0.0
-                    amount = float(r[5]) if r[5] not in (None, "") else qty * rate
-
-                    product = next((it for it in self.items if it["name"] == item_name), None)
-                    brand = product["category"] if product and product.get("category") else "Unknown"
-
-                    self.movements.append({
-                        "date": date_val,
-                        "voucher_no": None,
-                        "company": brand,
-                        "item": "item_name",
-                        "qty": qty,
-                        "rate": rate,
-                        "amount": amount,
-                        "movement_type": "OUT" if amount > 0 else "IN"
-                    })
+                    results[name] = fut.result()
                 except Exception as e:
-                    logging.error("Bad VchStockItem row: %s | error: %s", r, e)
+                    logging.error("%s query failed: %s", name, e)
+
+        if "StockItem" in results:
+            self._build_items(results["StockItem"])
+        else:
+            self.item_index = ItemIndex(self.items)
+        if "Ledger" in results:
+            self._build_companies(results["Ledger"])
+        if "VchStockItem" in results:
+            self._build_movements(results["VchStockItem"])
 
-            logging.info("Fetched %d voucher stock movements", len(self.movements))
+    # -------------------------
+    # WATERMARK
+    # -------------------------
+    def _read_watermark(self):
+        """Last loaded movement date (YYYY-MM-DD) from etl_state, or None."""
+        try:
+            if self.target == "sqlite":
+                conn = sqlite3.connect(str(SQLITE_DB))
+                row = conn.execute("SELECT last_sync FROM etl_state WHERE id=?", (MOVEMENTS_WATERMARK,)).fetchone()
+            else:
+                conn = mysql.connect(**self.mysql_cfg)
+                cur = conn.cursor()
+                cur.execute("SELECT last_sync FROM etl_state WHERE id=%s", (MOVEMENTS_WATERMARK,))
+                row = cur.fetchone()
+            conn.close()
         except Exception as e:
-            logging.error("VchStockItem query failed: %s", e)
+            logging.warning("Could not read movement watermark (%s); doing a full extract", e)
+            return None
+        if not row or not row[0]:
+            return None
+        return str(row[0])[:10]
 
-        conn.close()
+    def _next_watermark(self):
+        dates = [m["date"] for m in self.movements if m.get("date")]
+        return max(dates) if dates else self.since
 
     # -------------------------
     # TRANSFORM
     # -------------------------
     def transform(self):
         logging.info("Transform step (deduplicating)")
+        t0 = time.perf_counter()
         self.companies = list({c["name"]: c for c in self.companies}.values())
-        self.items = list({i["name"]: i for i in self.items if i.get("name")}.values())
+        self.item_index = ItemIndex(i for i in self.items if i.get("name"))
+        self.items = self.item_index.items()
+        self._add_stage("transform", len(self.items) + len(self.movements), time.perf_counter() - t0)
         logging.info("Transform complete: %d companies, %d items, %d movements",
                      len(self.companies), len(self.items), len(self.movements))
 
@@ -151,6 +495,8 @@ class ETLPipeline:
     # LOAD
     # -------------------------
     def load(self, reset=False):
+        if reset and self.since:
+            raise ValueError("reset=True needs a full extract, not an incremental one")
         if self.target == "mysql":
             self._load_mysql(reset=reset)
         elif self.target == "sqlite":
@@ -159,48 +505,97 @@ class ETLPipeline:
             raise ValueError(f"Unknown target {self.target}")
 
     def _load_sqlite(self, reset=False):
+        """
+        Bulk load into the offline SQLite copy: WAL journal and relaxed sync /
+        big page cache for the load, one transaction with executemany per
+        table, and movement indexes (re)built once after the insert.
+        """
         db_path = Path(SQLITE_DB)
         conn = sqlite3.connect(str(db_path))
         cur = conn.cursor()
+        for pragma in SQLITE_LOAD_PRAGMAS:
+            cur.execute(pragma)
 
         if reset:
             cur.execute("DROP TABLE IF EXISTS stock_movements")
             cur.execute("DROP TABLE IF EXISTS stock_items")
             conn.commit()
 
-        cur.executescript(open(Path(__file__).parent / "schema.sql").read())
-
-        for m in self.movements:
-            cur.execute("""INSERT INTO stock_movements
-                (date,voucher_no,company,item,qty,rate,amount,movement_type)
-                VALUES (?,?,?,?,?,?,?,?)""",
-                (m["date"], m["voucher_no"], m["company"], m["item"],
-                 m["qty"], m["rate"], m["amount"], m["movement_type"]))
-
-        for i in self.items:
-            cur.execute("""INSERT INTO stock_items
+        cur.executescript(SQLITE_SCHEMA)
+        cur.execute(SQLITE_MOVEMENT_HASH_INDEX)
+        # cheaper to rebuild the movement indexes once than to maintain them per row
+        for name, _ in SQLITE_MOVEMENT_INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+        stats = {}
+        t0 = time.perf_counter()
+        with conn:
+            if self.incremental:
+                if self.since:
+                    cur.execute("DELETE FROM stock_movements WHERE date >= ?", (self.since,))
+                else:
+                    cur.execute("DELETE FROM stock_movements")
+            else:
+                # rows loaded before hashing cannot be matched; the full extract replaces them
+                cur.execute("DELETE FROM stock_movements WHERE movement_hash IS NULL")
+
+            before = conn.total_changes
+            t1 = time.perf_counter()
+            cur.executemany("""INSERT OR IGNORE INTO stock_movements
+                (date,voucher_no,company,item,qty,rate,amount,movement_type,movement_hash)
+                VALUES (?,?,?,?,?,?,?,?,?)""",
+                self._movement_rows(self.movements))
+            stats["stock_movements"] = conn.total_changes - before
+            self._add_stage("load_stock_movements", stats["stock_movements"], time.perf_counter() - t1)
+
+            t1 = time.perf_counter()
+            cur.executemany("""INSERT OR REPLACE INTO stock_items
                 (name,category,base_unit,opening_qty,opening_rate)
                 VALUES (?,?,?,?,?)""",
-                (i["name"], i.get("category"), i.get("base_unit"),
-                 i.get("opening_qty", 0), i.get("opening_rate", 0)))
-
+                (self._item_tuple(i) for i in self.items))
+            stats["stock_items"] = len(self.items)
+            self._add_stage("load_stock_items", stats["stock_items"], time.perf_counter() - t1)
+
+            wm = self._next_watermark()
+            if wm:
+                cur.execute("INSERT OR REPLACE INTO etl_state (id, last_sync) VALUES (?, ?)", (MOVEMENTS_WATERMARK, wm))
+        insert_seconds = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _, ddl in SQLITE_MOVEMENT_INDEXES:
+            cur.execute(ddl)
+        cur.execute("PRAGMA optimize")
         conn.commit()
+        index_seconds = time.perf_counter() - t0
         conn.close()
-        logging.info("SQLite load complete")
+        self._add_stage("index", seconds=index_seconds)
+
+        total = sum(stats.values())
+        self.load_stats = {
+            "rows": stats,
+            "insert_seconds": round(insert_seconds, 3),
+            "index_seconds": round(index_seconds, 3),
+            "rows_per_sec": round(total / insert_seconds, 1) if insert_seconds else None,
+        }
+        logging.info("SQLite load complete: %s", self.load_stats)
 
-    def _load_mysql(self, reset=False):
-        if mysql is None:
-            raise RuntimeError("mysql-connector-python not installed")
+    @staticmethod
+    def _movement_tuple(m):
+        return (m["date"], m["voucher_no"], m["company"], m["item"],
+                m["qty"], m["rate"], m["amount"], m["movement_type"])
 
-        conn = mysql.connect(**self.mysql_cfg)
-        cur = conn.cursor()
+    @staticmethod
+    def _movement_rows(movements, seen=None):
+        """Movement tuples in MOVEMENT_COLUMNS order, ending with the content hash."""
+        rows = [ETLPipeline._movement_tuple(m) for m in movements]
+        return [r + (h,) for r, h in zip(rows, movement_hashes(rows, seen))]
 
-        if reset:
-            logging.warning("Dropping existing tables before reload (reset=True)")
-            cur.execute("DROP TABLE IF EXISTS stock_movements")
-            cur.execute("DROP TABLE IF EXISTS stock_items")
-            conn.commit()
+    @staticmethod
+    def _item_tuple(i):
+        return (i["name"], i.get("category"), i.get("base_unit"),
+                i.get("opening_qty", 0), i.get("opening_rate", 0))
 
+    def _apply_mysql_schema(self, cur):
         schema_path = Path(__file__).parent / "schema.sql"
         with open(schema_path, "r") as f:
             schema_sql = f.read()
@@ -210,31 +605,231 @@ class ETLPipeline:
             if stmt:
                 cur.execute(stmt)
 
-        insert_sql = """INSERT INTO stock_movements
-            (date,voucher_no,company,item,qty,rate,amount,movement_type)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s)"""
-        rows = [(m["date"], m["voucher_no"], m["company"], m["item"],
-                 m["qty"], m["rate"], m["amount"], m["movement_type"])
-                for m in self.movements]
+    def _replace_movements_since(self, cur):
+        # the watermark day is re-extracted, so replace everything from it on
+        if self.since:
+            cur.execute("DELETE FROM stock_movements WHERE date >= %s", (self.since,))
+        else:
+            cur.execute("DELETE FROM stock_movements")
+        logging.info("Replaced %d stock_movements since %s", cur.rowcount, self.since or "the beginning")
+
+    def _drop_unhashed_movements(self, cur):
+        # rows loaded before movement_hash existed cannot be matched; a full
+        # extract re-inserts them with hashes
+        cur.execute("DELETE FROM stock_movements WHERE movement_hash IS NULL")
+        if cur.rowcount:
+            logging.info("Replaced %d stock_movements loaded without a hash", cur.rowcount)
+
+    def _load_mysql(self, reset=False):
+        if mysql is None:
+            raise RuntimeError("mysql-connector-python not installed")
+
+        conn = mysql.connect(**self.mysql_cfg)
+        cur = conn.cursor()
+        self._apply_mysql_schema(cur)
+
+        if reset:
+            # Full reload: stage into shadow tables and swap them in atomically,
+            # so readers never see empty or half-loaded tables.
+            logging.info("Full reload via shadow-table swap (reset=True)")
+            items = {i["name"]: i for i in self.items}.values()
+            t0 = time.perf_counter()
+            shadow_swap_load(conn, [
+                ("stock_items", ITEM_COLUMNS, [self._item_tuple(i) for i in items]),
+                ("stock_movements", MOVEMENT_COLUMNS, self._movement_rows(self.movements)),
+            ], loader=self._bulk_loader)
+            # staging, index rebuild and RENAME, beyond the row loads themselves
+            loaded = sum(self.stages.get(f"load_{t}", {}).get("seconds", 0.0)
+                         for t in ("stock_items", "stock_movements"))
+            self._add_stage("swap", seconds=time.perf_counter() - t0 - loaded)
+            self._refresh_availability(cur)
+            self._save_watermark_mysql(cur)
+            conn.commit()
+            conn.close()
+            logging.info("MySQL load complete")
+            return
+
+        t0 = time.perf_counter()
+        if self.incremental:
+            self._replace_movements_since(cur)
+        else:
+            self._drop_unhashed_movements(cur)
+
+        rows = self._movement_rows(self.movements)
+        n = 0
         if rows:
-            cur.executemany(insert_sql, rows)
-            logging.info("Inserted %d stock_movements", cur.rowcount)
-
-        insert_items = """INSERT INTO stock_items
-            (name,category,base_unit,opening_qty,opening_rate)
-            VALUES (%s,%s,%s,%s,%s)
-            ON DUPLICATE KEY UPDATE
-                category=VALUES(category),
-                base_unit=VALUES(base_unit),
-                opening_qty=VALUES(opening_qty),
-                opening_rate=VALUES(opening_rate)"""
-        rows_items = [(i["name"], i.get("category"), i.get("base_unit"),
-                       i.get("opening_qty", 0), i.get("opening_rate", 0))
-                      for i in self.items]
+            n = bulk_insert(cur, "stock_movements", MOVEMENT_COLUMNS, rows,
+                            method=self.load_method, ignore=True)
+            logging.info("Inserted %d stock_movements (%s), %d already present",
+                         n, self.load_method, len(rows) - n)
+        self._add_stage("load_stock_movements", n, time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        rows_items = [self._item_tuple(i) for i in self.items]
         if rows_items:
-            cur.executemany(insert_items, rows_items)
+            cur.executemany(ITEM_UPSERT_SQL, rows_items)
             logging.info("Inserted/updated %d stock_items", cur.rowcount)
+        self._add_stage("load_stock_items", len(rows_items), time.perf_counter() - t0)
+
+        self._refresh_availability(cur)
 
+        t0 = time.perf_counter()
+        self._save_watermark_mysql(cur)
         conn.commit()
         conn.close()
+        self._add_stage("commit", seconds=time.perf_counter() - t0)
         logging.info("MySQL load complete")
+
+    def _refresh_availability(self, cur):
+        # the load touches every item, so stock_availability is rebuilt in one
+        # set-based statement rather than per item
+        t0 = time.perf_counter()
+        refresh_availability(cur)
+        self._add_stage("availability", seconds=time.perf_counter() - t0)
+
+    def _bulk_loader(self, cur, table, columns, rows):
+        t0 = time.perf_counter()
+        n = bulk_insert(cur, table, columns, rows, method=self.load_method)
+        self._add_stage("load_" + table.replace(SHADOW_SUFFIX, ""), n, time.perf_counter() - t0)
+        return n
+
+    def benchmark_load(self):
+        """
+        Time every load method on the extracted movements against a scratch
+        copy of stock_movements. Nothing is written to the live tables.
+        """
+        if mysql is None:
+            raise RuntimeError("mysql-connector-python not installed")
+        conn = mysql.connect(**dict(self.mysql_cfg, allow_local_infile=True))
+        try:
+            self._apply_mysql_schema(conn.cursor())
+            rows = self._movement_rows(self.movements)
+            return benchmark_load_methods(conn, "stock_movements", MOVEMENT_COLUMNS, rows)
+        finally:
+            conn.close()
+
+    def _save_watermark_mysql(self, cur, wm=None):
+        wm = wm or self._next_watermark()
+        if wm:
+            cur.execute("""INSERT INTO etl_state (id, last_sync) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE last_sync=VALUES(last_sync)""", (MOVEMENTS_WATERMARK, wm))
+            logging.info("Movement watermark now %s", wm)
+
+    # -------------------------
+    # STREAMING RUN
+    # -------------------------
+    def _stream_rows(self, src, query, convert, chunk_size, stage):
+        """Yield lists of converted rows, one per fetchmany batch, timing the extract stage."""
+        t0 = time.perf_counter()
+        cur = src.cursor()
+        cur.execute(query)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            batch = [x for x in map(convert, rows) if x is not None]
+            stage["rows"] += len(batch)
+            stage["bytes"] = stage.get("bytes", 0) + row_bytes(rows)
+            stage["seconds"] += time.perf_counter() - t0
+            yield batch
+            t0 = time.perf_counter()
+        cur.close()
+        stage["seconds"] += time.perf_counter() - t0
+
+    def run_streaming(self, chunk_size=None):
+        """
+        Extract -> transform -> load in chunks of `chunk_size` rows (MySQL target).
+
+        Rows are read with fetchmany, transformed per batch and committed with one
+        bulk insert per batch, so memory does not grow with the dataset. Only the
+        item dimension (needed to enrich movements), the dedup key set and the
+        movement hash occurrence counts are kept across batches; ledgers are not
+        loaded by this pipeline and are not read. Movements are inserted with
+        IGNORE on movement_hash, so an interrupted run can be retried.
+        Incremental mode is honoured. Returns per-stage stats.
+        """
+        if self.target != "mysql":
+            raise ValueError("Streaming mode supports the mysql target only")
+        if mysql is None:
+            raise RuntimeError("mysql-connector-python not installed")
+        chunk_size = chunk_size or self.chunk_size
+        stages = {name: {"rows": 0, "seconds": 0.0} for name in
+                  ("extract_items", "extract_movements", "transform", "load_items", "load_movements")}
+        if self.incremental:
+            self.since = self._read_watermark()
+
+        src = self._connect_source()
+        dst = mysql.connect(**self.mysql_cfg)
+        cur = dst.cursor()
+        try:
+            self._apply_mysql_schema(cur)
+
+            # items: upserts make the last duplicate win, as transform() does
+            self.item_index = ItemIndex()
+            seen = set()
+            for batch in self._stream_rows(src, ITEMS_QUERY, self._item_from_row, chunk_size, stages["extract_items"]):
+                t0 = time.perf_counter()
+                rows = []
+                for it in batch:
+                    seen.add(normalize_name(it["name"]))
+                    self.item_index.add(it)
+                    rows.append(self._item_tuple(it))
+                stages["transform"]["rows"] += len(batch)
+                stages["transform"]["seconds"] += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                cur.executemany(ITEM_UPSERT_SQL, rows)
+                dst.commit()
+                stages["load_items"]["rows"] += len(rows)
+                stages["load_items"]["seconds"] += time.perf_counter() - t0
+            logging.info("Streamed %d stock items (%d distinct)", stages["load_items"]["rows"], len(seen))
+
+            t0 = time.perf_counter()
+            if self.incremental:
+                self._replace_movements_since(cur)
+            else:
+                self._drop_unhashed_movements(cur)
+            dst.commit()
+            stages["load_movements"]["seconds"] += time.perf_counter() - t0
+
+            watermark = self.since
+            # occurrence numbers of identical lines must continue across batches
+            hash_seen = {}
+            for batch in self._stream_rows(src, MOVEMENTS_QUERY, self._movement_from_row, chunk_size, stages["extract_movements"]):
+                t0 = time.perf_counter()
+                rows = self._movement_rows(batch, hash_seen)
+                dates = [m["date"] for m in batch if m.get("date")]
+                if dates:
+                    watermark = max([watermark] + dates) if watermark else max(dates)
+                stages["transform"]["rows"] += len(batch)
+                stages["transform"]["seconds"] += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                # committed per batch: a failed run can simply be retried
+                n = bulk_insert(cur, "stock_movements", MOVEMENT_COLUMNS, rows,
+                                method=self.load_method, ignore=True)
+                dst.commit()
+                stages["load_movements"]["rows"] += n
+                stages["load_movements"]["seconds"] += time.perf_counter() - t0
+            logging.info("Streamed %d stock movements", stages["load_movements"]["rows"])
+
+            t0 = time.perf_counter()
+            refresh_availability(cur)
+            dst.commit()
+            stages["availability"] = {"rows": 0, "seconds": time.perf_counter() - t0}
+
+            self._save_watermark_mysql(cur, watermark)
+            dst.commit()
+        finally:
+            cur.close()
+            dst.close()
+            src.close()
+        self._save_recording()
+
+        for name, st in stages.items():
+            st["seconds"] = round(st["seconds"], 3)
+            st["rows_per_sec"] = round(st["rows"] / st["seconds"], 1) if st["seconds"] else None
+            logging.info("stage %-17s rows=%-8d %8.3fs  %s rows/s", name, st["rows"], st["seconds"], st["rows_per_sec"])
+        stats = {"chunk_size": chunk_size, "stages": stages, "peak_rss_mb": peak_rss_mb()}
+        logging.info("Streaming run complete (peak RSS %s MB)", stats["peak_rss_mb"])
+        return stats
@@ -1,13 +1,53 @@
+import argparse
 import logging
 from pipeline import ETLPipeline
+from telemetry import format_trend
 
 def main():
+    parser = argparse.ArgumentParser(description="Tally -> MySQL ETL")
+    parser.add_argument("--target", choices=("mysql", "sqlite"), default="mysql",
+                        help="load into MySQL (default) or the offline SQLite copy")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only load movements since the last successful run's watermark")
+    parser.add_argument("--stream", action="store_true",
+                        help="extract/transform/load in bounded chunks instead of holding everything in memory")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="rows per chunk in --stream mode (default ETL_CHUNK_SIZE or 5000)")
+    parser.add_argument("--parallel", action="store_true",
+                        help="run independent Tally queries concurrently on separate connections")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="max concurrent source queries with --parallel (default ETL_EXTRACT_WORKERS or 3)")
+    parser.add_argument("--load-method", choices=("infile", "executemany"), default=None,
+                        help="MySQL movement load path (default ETL_LOAD_METHOD or infile)")
+    parser.add_argument("--benchmark-load", action="store_true",
+                        help="extract, then time each MySQL load method on a scratch table instead of loading")
+    parser.add_argument("--trend", type=int, metavar="N", default=None,
+                        help="print stage timings of the last N recorded runs for --target and exit")
+    parser.add_argument("--fixture", default=None,
+                        help="replay a recorded/synthetic Tally fixture instead of ODBC (default TALLY_FIXTURE)")
+    parser.add_argument("--record", default=None,
+                        help="save the raw Tally rows read during this run to a fixture file")
+    args = parser.parse_args()
+
+    if args.trend:
+        print(format_trend(ETLPipeline(target=args.target).recent_runs(args.trend)))
+        return
+
     logging.info("🚀 Starting ETL process")
-    # just pass target, mysql config is loaded automatically from .env
-    etl = ETLPipeline(target="mysql")
-    etl.extract()
-    etl.transform()
-    etl.load()
+    # mysql config is loaded automatically from .env
+    kwargs = {"load_method": args.load_method} if args.load_method else {}
+    etl = ETLPipeline(target=args.target, incremental=args.incremental, parallel=args.parallel,
+                      fixture=args.fixture, record=args.record, **kwargs)
+    if args.workers:
+        etl.extract_workers = args.workers
+    if args.benchmark_load:
+        etl.extract()
+        etl.transform()
+        for method, result in etl.benchmark_load().items():
+            logging.info("%s: %s", method, result)
+    else:
+        # recorded in etl_runs (mysql) or etl_runs.jsonl (sqlite)
+        etl.run(stream=args.stream, chunk_size=args.chunk_size)
     logging.info("✅ ETL finished")
 
 if __name__ == "__main__":
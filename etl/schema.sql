@@ -3,19 +3,50 @@
 
 SET FOREIGN_KEY_CHECKS = 0;
 
+-- --------------------------------------------------
+-- Table: etl_runs
+-- --------------------------------------------------
+CREATE TABLE IF NOT EXISTS `etl_runs` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `started_at` datetime NOT NULL,
+  `finished_at` datetime DEFAULT NULL,
+  `target` varchar(10) NOT NULL,
+  `mode` varchar(20) NOT NULL,
+  `outcome` enum('ok','failed') NOT NULL,
+  `error` text,
+  `total_seconds` decimal(10,3) DEFAULT NULL,
+  `rows_loaded` int DEFAULT NULL,
+  `rows_per_sec` decimal(12,1) DEFAULT NULL,
+  `peak_rss_mb` decimal(10,1) DEFAULT NULL,
+  `bytes_received` bigint DEFAULT NULL,
+  `stages` json DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_etl_runs_started` (`started_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
 -- --------------------------------------------------
 -- Table: etl_state
 -- --------------------------------------------------
-CREATE TABLE `etl_state` (
+CREATE TABLE IF NOT EXISTS `etl_state` (
   `id` varchar(64) NOT NULL,
   `last_sync` timestamp NULL DEFAULT NULL,
   PRIMARY KEY (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
+-- --------------------------------------------------
+-- Table: maintenance_state
+-- --------------------------------------------------
+CREATE TABLE IF NOT EXISTS `maintenance_state` (
+  `name` varchar(64) NOT NULL,
+  `cursor_value` varchar(255) DEFAULT NULL,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
 -- --------------------------------------------------
 -- Table: movement_hashes
 -- --------------------------------------------------
-CREATE TABLE `movement_hashes` (
+CREATE TABLE IF NOT EXISTS `movement_hashes` (
   `id` int NOT NULL AUTO_INCREMENT,
   `dedupe_key` char(40) NOT NULL,
   `movement_id` int DEFAULT NULL,
@@ -27,7 +58,7 @@ CREATE TABLE `movement_hashes` (
 -- --------------------------------------------------
 -- Table: sales
 -- --------------------------------------------------
-CREATE TABLE `sales` (
+CREATE TABLE IF NOT EXISTS `sales` (
   `id` int NOT NULL AUTO_INCREMENT,
   `date` date DEFAULT NULL,
   `voucher_no` varchar(100) DEFAULT NULL,
@@ -39,10 +70,26 @@ CREATE TABLE `sales` (
   PRIMARY KEY (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
+-- --------------------------------------------------
+-- Table: stock_availability
+-- --------------------------------------------------
+CREATE TABLE IF NOT EXISTS `stock_availability` (
+  `item` varchar(255) NOT NULL,
+  `total_qty` decimal(20,4) NOT NULL DEFAULT '0.0000',
+  `sold_qty` decimal(20,4) NOT NULL DEFAULT '0.0000',
+  `reserved_qty` decimal(20,4) NOT NULL DEFAULT '0.0000',
+  `available_qty` decimal(20,4) GENERATED ALWAYS AS ((`total_qty` - `reserved_qty`)) STORED,
+  `reserved_by` varchar(255) DEFAULT NULL,
+  `reserve_from` date DEFAULT NULL,
+  `reserve_until` date DEFAULT NULL,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`item`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
 -- --------------------------------------------------
 -- Table: stock_items
 -- --------------------------------------------------
-CREATE TABLE `stock_items` (
+CREATE TABLE IF NOT EXISTS `stock_items` (
   `id` int NOT NULL AUTO_INCREMENT,
   `name` varchar(255) DEFAULT NULL,
   `category` varchar(255) DEFAULT NULL,
@@ -57,7 +104,7 @@ CREATE TABLE `stock_items` (
 -- --------------------------------------------------
 -- Table: stock_movements
 -- --------------------------------------------------
-CREATE TABLE `stock_movements` (
+CREATE TABLE IF NOT EXISTS `stock_movements` (
   `id` int NOT NULL AUTO_INCREMENT,
   `date` date DEFAULT NULL,
   `voucher_no` varchar(100) DEFAULT NULL,
@@ -77,7 +124,7 @@ CREATE TABLE `stock_movements` (
 -- --------------------------------------------------
 -- Table: stock_reservations
 -- --------------------------------------------------
-CREATE TABLE `stock_reservations` (
+CREATE TABLE IF NOT EXISTS `stock_reservations` (
   `id` int NOT NULL AUTO_INCREMENT,
   `item` varchar(255) NOT NULL,
   `reserved_by` varchar(255) NOT NULL,
@@ -87,13 +134,14 @@ CREATE TABLE `stock_reservations` (
   `status` enum('ACTIVE','EXPIRED','CANCELLED') DEFAULT 'ACTIVE',
   `remarks` varchar(255) DEFAULT NULL,
   PRIMARY KEY (`id`),
-  KEY `idx_res_item_status_enddate` (`item`,`status`,`end_date`)
+  KEY `idx_res_item_status_enddate` (`item`,`status`,`end_date`),
+  KEY `idx_res_status_enddate` (`status`,`end_date`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------
 -- Table: users
 -- --------------------------------------------------
-CREATE TABLE `users` (
+CREATE TABLE IF NOT EXISTS `users` (
   `id` int NOT NULL AUTO_INCREMENT,
   `username` varchar(100) NOT NULL,
   `password_hash` varchar(255) NOT NULL,
@@ -0,0 +1,392 @@
+"""
+Recorded / synthetic Tally source.
+
+A fixture is a gzip-compressed JSON-lines file holding the raw rows Tally
+returned for each ODBC query, and optionally the JSON rows of gateway
+endpoints. The first line is a header:
+
+    {"version": 1, "datasets": [{"query", "table", "columns", "types"}, ...],
+     "gateway": ["stock_items", "stock_movements"]}
+
+followed by one line per row: [dataset_index, value, ...] for ODBC rows and
+["<endpoint>", {...}] for gateway rows. Rows are read back lazily, so a
+replayed extract streams just like a live one.
+
+connect(path) returns a pyodbc-like connection that replays a fixture, so
+ETLPipeline and tally_gateway run unchanged against it (TALLY_FIXTURE=path);
+app.sync_from_tally() reads the gateway rows directly. Recorder captures what
+a live connection fetches, and synthesize() writes N items / M movements of
+deterministic fake data:
+
+    python etl/tally_fixture.py synth --items 5000 --movements 100000 -o tally_100k.jsonl.gz
+    python etl/tally_fixture.py info tally_100k.jsonl.gz
+"""
+
+import re
+import gzip
+import json
+import random
+import argparse
+import datetime
+import threading
+from decimal import Decimal
+from itertools import chain
+
+FIXTURE_VERSION = 1
+
+_QUERY_RE = re.compile(r"^\s*SELECT\s+(.*?)\s+FROM\s+(\S+)"
+                       r"(?:\s+WHERE\s+(\S+)\s*>=\s*'((?:[^']|'')*)')?"
+                       r"(?:\s+ORDER\s+BY\s+(.*?))?\s*$", re.I | re.S)
+
+
+class Error(Exception):
+    """Raised for queries the fixture cannot answer (mirrors pyodbc.Error)."""
+
+
+def normalize_query(query):
+    return " ".join(query.split())
+
+
+def parse_query(query):
+    """
+    Return (columns, table, order_by columns, where) of a plain Tally SELECT;
+    `where` is (column, value) for a `WHERE $Col >= 'value'` seek, else None.
+    """
+    m = _QUERY_RE.match(query)
+    if not m:
+        raise Error(f"Unsupported query for fixture replay: {normalize_query(query)}")
+    columns = [c.strip() for c in m.group(1).split(",")]
+    order_by = [c.strip() for c in m.group(5).split(",")] if m.group(5) else []
+    where = (m.group(3), m.group(4).replace("''", "'")) if m.group(3) else None
+    return columns, m.group(2), order_by, where
+
+
+def _text_key(v):
+    # Tally compares and sorts text case-insensitively
+    return v.casefold() if isinstance(v, str) else v
+
+
+# -------------------------
+# WRITE
+# -------------------------
+def _column_types(row):
+    types = []
+    for v in row:
+        if isinstance(v, datetime.datetime):
+            types.append("datetime")
+        elif isinstance(v, datetime.date):
+            types.append("date")
+        else:
+            types.append(None)
+    return types
+
+
+def _encode(v):
+    if isinstance(v, (datetime.date, datetime.datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+
+def write_fixture(path, datasets=(), gateway=None):
+    """
+    Write a fixture. `datasets` is an iterable of (query, rows) and `gateway`
+    maps endpoint -> iterable of dicts; rows may be generators, they are
+    streamed to the file. Column types (dates) are taken from the first row.
+    """
+    headers, bodies = [], []
+    for query, rows in datasets:
+        rows = iter(rows)
+        first = next(rows, None)
+        columns, table, _, _ = parse_query(query)
+        headers.append({
+            "query": normalize_query(query),
+            "table": table,
+            "columns": columns,
+            "types": _column_types(first) if first is not None else [None] * len(columns),
+        })
+        bodies.append(chain([first], rows) if first is not None else iter(()))
+    gateway = gateway or {}
+
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(json.dumps({"version": FIXTURE_VERSION, "datasets": headers, "gateway": list(gateway)}) + "\n")
+        for idx, rows in enumerate(bodies):
+            for row in rows:
+                f.write(json.dumps([idx] + [_encode(v) for v in row]) + "\n")
+        for endpoint, rows in gateway.items():
+            for row in rows:
+                f.write(json.dumps([endpoint, row]) + "\n")
+
+
+class Recorder:
+    """
+    Capture the rows live connections fetch. Wrap every source connection with
+    wrap(), then save(path). The last execution of a query wins.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.datasets = {}
+
+    def wrap(self, conn):
+        return _RecordingConnection(conn, self)
+
+    def _store(self, query, rows):
+        with self._lock:
+            self.datasets[normalize_query(query)] = rows
+
+    def save(self, path, gateway=None):
+        write_fixture(path, list(self.datasets.items()), gateway)
+
+
+class _RecordingConnection:
+    def __init__(self, conn, recorder):
+        self._conn = conn
+        self._recorder = recorder
+
+    def cursor(self):
+        return _RecordingCursor(self._conn.cursor(), self._recorder)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class _RecordingCursor:
+    def __init__(self, cur, recorder):
+        self._cur = cur
+        self._recorder = recorder
+        self._rows = None
+
+    def execute(self, query, *params):
+        self._cur.execute(query, *params)
+        self._rows = []
+        self._recorder._store(query, self._rows)
+        return self
+
+    def _keep(self, rows):
+        if self._rows is not None:
+            self._rows.extend(tuple(r) for r in rows)
+        return rows
+
+    def fetchall(self):
+        return self._keep(self._cur.fetchall())
+
+    def fetchmany(self, size=1):
+        return self._keep(self._cur.fetchmany(size))
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        if row is not None:
+            self._keep([row])
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+# -------------------------
+# READ / REPLAY
+# -------------------------
+def read_header(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+    if header.get("version") != FIXTURE_VERSION:
+        raise Error(f"Unsupported fixture version {header.get('version')} in {path}")
+    return header
+
+
+def _decoders(types):
+    out = []
+    for t in types:
+        if t == "date":
+            out.append(lambda v: datetime.date.fromisoformat(v) if v else v)
+        elif t == "datetime":
+            out.append(lambda v: datetime.datetime.fromisoformat(v) if v else v)
+        else:
+            out.append(None)
+    return out
+
+
+def iter_dataset(path, idx, types):
+    prefix = f"[{idx},"
+    decoders = _decoders(types)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        f.readline()
+        for line in f:
+            if not line.startswith(prefix):
+                continue
+            row = json.loads(line)[1:]
+            yield tuple(d(v) if d else v for d, v in zip(decoders, row))
+
+
+def iter_gateway(path, endpoint):
+    """Rows of a recorded gateway endpoint (the JSON list it returned)."""
+    if endpoint not in read_header(path).get("gateway", []):
+        raise Error(f"Fixture {path} has no gateway data for {endpoint}")
+    prefix = "[" + json.dumps(endpoint) + ","
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        f.readline()
+        for line in f:
+            if line.startswith(prefix):
+                yield json.loads(line)[1]
+
+
+def connect(path):
+    """pyodbc-like connection replaying the fixture at `path`."""
+    return FixtureConnection(path)
+
+
+class FixtureConnection:
+    def __init__(self, path):
+        self.path = str(path)
+        self.datasets = read_header(self.path)["datasets"]
+
+    def cursor(self):
+        return FixtureCursor(self)
+
+    def close(self):
+        pass
+
+    def _resolve(self, query):
+        """Pick the dataset for `query`: an exact recording, else any dataset of
+        the same table that has all requested columns (projected)."""
+        columns, table, order_by, where = parse_query(query)
+        base = normalize_query(re.sub(r"\s+(?:WHERE|ORDER\s+BY)\s+.*$", "", query, flags=re.I | re.S))
+        for idx, ds in enumerate(self.datasets):
+            if ds["query"] == base:
+                return idx, ds, None, order_by, where
+        for idx, ds in enumerate(self.datasets):
+            if ds["table"].lower() == table.lower() and set(columns) <= set(ds["columns"]):
+                return idx, ds, [ds["columns"].index(c) for c in columns], order_by, where
+        raise Error(f"No recorded rows for: {normalize_query(query)}")
+
+
+class FixtureCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = iter(())
+        self.description = None
+
+    def execute(self, query, *params):
+        idx, ds, projection, order_by, where = self._conn._resolve(query)
+        rows = iter_dataset(self._conn.path, idx, ds["types"])
+        columns = ds["columns"]
+        if where is not None:
+            col, value = columns.index(where[0]), where[1].casefold()
+            rows = (r for r in rows if r[col] is not None and _text_key(str(r[col])) >= value)
+        if projection is not None:
+            rows = (tuple(r[i] for i in projection) for r in rows)
+            columns = [columns[i] for i in projection]
+        if order_by:
+            keys = [columns.index(c) for c in order_by if c in columns]
+            rows = iter(sorted(rows, key=lambda r: tuple((r[k] is None, _text_key(r[k])) for k in keys)))
+        self._rows = rows
+        self.description = [(c, None, None, None, None, None, True) for c in columns]
+        return self
+
+    def fetchmany(self, size=1):
+        return [r for _, r in zip(range(size), self._rows)]
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def close(self):
+        self._rows = iter(())
+
+
+# -------------------------
+# SYNTHETIC DATA
+# -------------------------
+SYNTH_START = datetime.date(2024, 4, 1)
+SYNTH_COLUMNS = {
+    "Company": ["$Name", "$StartingFrom", "$EndingAt"],
+    "Ledger": ["$Name", "$Parent"],
+    "StockItem": ["$Name", "$Parent", "$BaseUnits", "$_ClosingBalance", "$_ClosingRate"],
+    "VchStockItem": ["$_LastSaleDate", "$_LastSaleParty", "$PriceLevel", "$StockItemName",
+                     "$_LastSalePrice", "$_OutwardQuantity", "$_OutwardValue", "$AlterID"],
+}
+
+
+def _synth_items(n_items, seed):
+    rnd = random.Random(seed)
+    brands = max(1, n_items // 50)
+    for i in range(n_items):
+        yield (f"Item {i:06d}", f"Brand {i % brands:03d}", rnd.choice(("Nos", "Kg", "Box", "Ltr")),
+               float(rnd.randint(0, 500)), round(rnd.uniform(10, 500), 2))
+
+
+def _synth_parties(n_items):
+    return [f"Party {j:05d}" for j in range(max(5, n_items // 20))]
+
+
+def _synth_movements(n_items, n_movements, seed):
+    rnd = random.Random(seed + 1)
+    parties = _synth_parties(n_items)
+    for k in range(n_movements):
+        i = rnd.randrange(n_items)
+        party = rnd.choice(parties)
+        rate = round(rnd.uniform(10, 500), 2)
+        qty = float(rnd.randint(1, 20))
+        # ~10% inward lines (negative value)
+        amount = round(qty * rate * (-1 if rnd.random() < 0.1 else 1), 2)
+        day = SYNTH_START + datetime.timedelta(days=rnd.randrange(365))
+        yield (day, party, party, f"Item {i:06d}", rate, qty, amount, k + 1)
+
+
+def synthesize(path, n_items, n_movements, seed=42):
+    """
+    Write a fixture with `n_items` stock items and `n_movements` voucher lines,
+    plus the matching gateway rows. Same arguments, same file contents.
+    """
+    n_items = max(1, n_items)
+
+    def table(name):
+        return f"SELECT {', '.join(SYNTH_COLUMNS[name])} FROM {name}"
+
+    datasets = [
+        (table("Company"), [("Synthetic Traders", SYNTH_START, SYNTH_START.replace(year=SYNTH_START.year + 1))]),
+        (table("Ledger"), ((p, "Sundry Debtors") for p in _synth_parties(n_items))),
+        (table("StockItem"), _synth_items(n_items, seed)),
+        (table("VchStockItem"), _synth_movements(n_items, n_movements, seed)),
+    ]
+    # same shapes tally_gateway's /stock_items and /stock_movements return
+    gateway = {
+        "stock_items": ({"name": n, "category": c, "base_unit": u, "closing_qty": q, "closing_rate": r}
+                        for n, c, u, q, r in _synth_items(n_items, seed)),
+        "stock_movements": ({"date": d.isoformat(), "voucher_no": None, "company": pl, "item": it,
+                             "qty": q, "rate": r, "amount": a, "movement_type": "OUT" if a > 0 else "IN"}
+                            for d, _, pl, it, r, q, a, _ in _synth_movements(n_items, n_movements, seed)),
+    }
+    write_fixture(path, datasets, gateway)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or inspect Tally fixtures")
+    sub = parser.add_subparsers(dest="command", required=True)
+    synth = sub.add_parser("synth", help="write a synthetic fixture")
+    synth.add_argument("--items", type=int, default=1000)
+    synth.add_argument("--movements", type=int, default=10000)
+    synth.add_argument("--seed", type=int, default=42)
+    synth.add_argument("-o", "--output", required=True)
+    info = sub.add_parser("info", help="list the datasets in a fixture")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "synth":
+        synthesize(args.output, args.items, args.movements, args.seed)
+        print(f"Wrote {args.output}")
+    else:
+        header = read_header(args.path)
+        for idx, ds in enumerate(header["datasets"]):
+            rows = sum(1 for _ in iter_dataset(args.path, idx, ds["types"]))
+            print(f"{ds['table']:<14} {rows:>9} rows  {ds['query']}")
+        for endpoint in header.get("gateway", []):
+            print(f"gateway {endpoint:<20} {sum(1 for _ in iter_gateway(args.path, endpoint)):>9} rows")
+
+
+if __name__ == "__main__":
+    main()
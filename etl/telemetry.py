@@ -0,0 +1,143 @@
+"""
+ETL run telemetry.
+
+Every ETLPipeline.run() is recorded with per-stage timings, row counts and
+outcome: in the `etl_runs` table for the MySQL target, or as one JSON line per
+run in etl_runs.jsonl (next to inventory.db) for the SQLite target.
+"""
+
+import json
+import datetime
+import statistics
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+ETL_RUNS_FILE = PROJECT_ROOT / "etl_runs.jsonl"
+
+# A stage counts as regressed in the trend when it is this much slower than
+# the median of the runs before it
+TREND_SLOWDOWN = 1.25
+
+
+def new_run(target, mode):
+    return {
+        "started_at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+        "target": target,
+        "mode": mode,
+        "outcome": None,
+        "error": None,
+        "stages": {},
+    }
+
+
+def finish_run(run, stages, outcome, error=None, peak_rss_mb=None):
+    """
+    Fill in totals. `stages` is {name: {"rows", "seconds"[, "bytes"]}}; rows of
+    load_* stages count as loaded, bytes of extract_* stages as received.
+    """
+    now = datetime.datetime.now()
+    started = datetime.datetime.fromisoformat(run["started_at"])
+    total = (now - started).total_seconds()
+    for st in stages.values():
+        st["seconds"] = round(st.get("seconds", 0.0), 3)
+        st["rows_per_sec"] = round(st["rows"] / st["seconds"], 1) if st.get("rows") and st["seconds"] else None
+    rows_loaded = sum(st.get("rows", 0) for name, st in stages.items() if name.startswith("load_"))
+    run.update({
+        "finished_at": now.isoformat(timespec="milliseconds"),
+        "outcome": outcome,
+        "error": error,
+        "total_seconds": round(total, 3),
+        "rows_loaded": rows_loaded,
+        "rows_per_sec": round(rows_loaded / total, 1) if total else None,
+        "peak_rss_mb": peak_rss_mb,
+        "bytes_received": sum(st.get("bytes") or 0 for name, st in stages.items() if name.startswith("extract_")),
+        "stages": stages,
+    })
+    return run
+
+
+def save_run_mysql(conn, run):
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO etl_runs (started_at, finished_at, target, mode, outcome, error, total_seconds,
+                              rows_loaded, rows_per_sec, peak_rss_mb, bytes_received, stages)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (run["started_at"], run["finished_at"], run["target"], run["mode"], run["outcome"],
+          run["error"], run["total_seconds"], run["rows_loaded"], run["rows_per_sec"],
+          run["peak_rss_mb"], run["bytes_received"], json.dumps(run["stages"])))
+    conn.commit()
+    cur.close()
+
+
+def recent_runs_mysql(conn, n):
+    """Last `n` runs, oldest first."""
+    cur = conn.cursor(dictionary=True)
+    cur.execute("""
+        SELECT started_at, finished_at, target, mode, outcome, error, total_seconds, rows_loaded,
+               rows_per_sec, peak_rss_mb, bytes_received, stages
+        FROM etl_runs ORDER BY id DESC LIMIT %s
+    """, (n,))
+    runs = cur.fetchall()
+    cur.close()
+    for r in runs:
+        r["started_at"] = str(r["started_at"])
+        r["stages"] = json.loads(r["stages"]) if r["stages"] else {}
+    return runs[::-1]
+
+
+def save_run_file(run, path=None):
+    with open(path or ETL_RUNS_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+def recent_runs_file(n, path=None):
+    """Last `n` runs, oldest first."""
+    path = Path(path or ETL_RUNS_FILE)
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    return [json.loads(line) for line in lines[-n:]]
+
+
+def format_trend(runs):
+    """
+    One line per run: outcome, total time, rows, rows/sec, RSS, bytes and the
+    seconds of every stage. Stages more than TREND_SLOWDOWN x the median of the
+    earlier successful runs are marked with '!'.
+    """
+    stage_names = []
+    for r in runs:
+        for name in r.get("stages") or {}:
+            if name not in stage_names:
+                stage_names.append(name)
+
+    header = ["started_at", "mode", "outcome", "total_s", "rows", "rows/s", "rss_mb", "bytes"] + stage_names
+    lines = [header]
+    history = {name: [] for name in stage_names}
+    for r in runs:
+        stages = r.get("stages") or {}
+        row = [str(r["started_at"])[:19], r.get("mode") or "", r.get("outcome") or "",
+               _num(r.get("total_seconds")), _num(r.get("rows_loaded")), _num(r.get("rows_per_sec")),
+               _num(r.get("peak_rss_mb")), _num(r.get("bytes_received"))]
+        for name in stage_names:
+            seconds = (stages.get(name) or {}).get("seconds")
+            cell = _num(seconds)
+            past = history[name]
+            if seconds is not None and past and seconds > statistics.median(past) * TREND_SLOWDOWN:
+                cell += "!"
+            if seconds is not None and r.get("outcome") == "ok":
+                past.append(float(seconds))
+            row.append(cell)
+        lines.append(row)
+
+    widths = [max(len(str(line[i])) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(str(c).rjust(w) for c, w in zip(line, widths)) for line in lines)
+
+
+def _num(value):
+    if value is None:
+        return "-"
+    if isinstance(value, int):
+        return str(value)
+    return f"{float(value):.3f}".rstrip("0").rstrip(".")
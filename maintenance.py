@@ -0,0 +1,26 @@
+"""
+Reservation maintenance worker: expires reservations past their end date and
+cancels over-reservations on a schedule (see app.run_reservation_maintenance).
+Several workers may run; a MySQL lock lets only one of them work at a time.
+
+    python maintenance.py
+    python maintenance.py --rebuild-availability   # backfill stock_availability and exit
+"""
+
+import argparse
+import logging
+from app import reservation_maintenance_loop, rebuild_stock_availability, MAINTENANCE_INTERVAL
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reservation maintenance worker")
+    parser.add_argument("--rebuild-availability", action="store_true",
+                        help="recompute stock_availability for every item and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.rebuild_availability:
+        rebuild_stock_availability()
+        logging.info("stock_availability rebuilt")
+    else:
+        logging.info("Reservation maintenance every %ds", MAINTENANCE_INTERVAL)
+        reservation_maintenance_loop()
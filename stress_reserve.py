@@ -0,0 +1,181 @@
+"""
+Concurrency stress test for stock reservations.
+
+Seeds a scratch MySQL database with a few items, then has many threads reserve
+overlapping (deliberately hot) items at once through /api/stock-reserve/bulk,
+mixed with single-item /api/stock-reserve calls, via the Flask test client.
+Afterwards it checks that:
+
+- no item has more ACTIVE reservations than its total qty (no oversell);
+- the reservations in the database are exactly the ones that got a 200;
+- stock_availability.reserved_qty matches the reservations of every item;
+- every request either succeeded or was rejected with 400 (no 500s).
+
+    python stress_reserve.py --threads 16 --requests 50 --items 20 --stock 100
+
+The database (BENCH_MYSQL_DB, default inventory_bench) is dropped and
+recreated; it must not be the live MYSQL_DB. Exits 1 when a check fails.
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+SCHEMA_FILE = PROJECT_ROOT / "etl" / "schema.sql"
+BENCH_MYSQL_DB = os.getenv("BENCH_MYSQL_DB", "inventory_bench")
+ITEM_PREFIX = "STRESS-"
+
+
+def prepare_database(n_items, stock):
+    import mysql.connector
+    cfg = {
+        "host": os.getenv("MYSQL_HOST", "localhost"),
+        "user": os.getenv("MYSQL_USER", "root"),
+        "password": os.getenv("MYSQL_PASSWORD", ""),
+        "port": int(os.getenv("MYSQL_PORT", 3306)),
+    }
+    conn = mysql.connector.connect(connection_timeout=3, **cfg)
+    cur = conn.cursor()
+    cur.execute(f"DROP DATABASE IF EXISTS `{BENCH_MYSQL_DB}`")
+    cur.execute(f"CREATE DATABASE `{BENCH_MYSQL_DB}`")
+    cur.execute(f"USE `{BENCH_MYSQL_DB}`")
+    for stmt in SCHEMA_FILE.read_text().split(";"):
+        stmt = stmt.strip()
+        if stmt:
+            cur.execute(stmt)
+    cur.executemany("""
+        INSERT INTO stock_items (name, category, base_unit, opening_qty, opening_rate)
+        VALUES (%s, 'stress', 'nos', %s, 1)
+    """, [(f"{ITEM_PREFIX}{n:04d}", stock) for n in range(n_items)])
+    from etl.availability import refresh_availability
+    refresh_availability(cur)
+    conn.commit()
+    conn.close()
+
+
+def pick_lines(rng, items, hot, max_lines):
+    """Random quote lines; the first `hot` items show up in most requests."""
+    k = rng.randint(1, max_lines)
+    chosen = set()
+    while len(chosen) < min(k, len(items)):
+        pool = items[:hot] if hot and rng.random() < 0.7 else items
+        chosen.add(rng.choice(pool))
+    lines = [{"item": item, "qty": rng.randint(1, 5)} for item in chosen]
+    # callers send items in any order; locking must not depend on it
+    rng.shuffle(lines)
+    return lines
+
+
+def worker(app, n, args, items, results, lock, start):
+    rng = random.Random(args.seed + n)
+    client = app.test_client()
+    start.wait()
+    for _ in range(args.requests):
+        lines = pick_lines(rng, items, args.hot, args.max_lines)
+        if rng.random() < args.single_ratio:
+            lines = lines[:1]
+            resp = client.post("/api/stock-reserve", json={"item": lines[0]["item"], "qty": lines[0]["qty"],
+                                                           "reserved_by": f"stress-{n}"})
+        else:
+            resp = client.post("/api/stock-reserve/bulk", json={"items": lines, "reserved_by": f"stress-{n}"})
+        with lock:
+            results["status"][resp.status_code] = results["status"].get(resp.status_code, 0) + 1
+            if resp.status_code == 200:
+                for line in lines:
+                    results["reserved"][line["item"]] = results["reserved"].get(line["item"], 0) + line["qty"]
+            elif resp.status_code != 400:
+                results["errors"].append((resp.status_code, (resp.get_json() or {}).get("error")))
+
+
+def check(items, reserved):
+    from app import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT i.name, i.opening_qty, IFNULL(r.qty, 0), a.reserved_qty
+        FROM stock_items i
+        LEFT JOIN (SELECT item, SUM(qty) AS qty FROM stock_reservations
+                   WHERE status='ACTIVE' GROUP BY item) r ON r.item = i.name
+        LEFT JOIN stock_availability a ON a.item = i.name
+        WHERE i.name LIKE %s
+    """, (ITEM_PREFIX + "%",))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    failures = []
+    for name, total, in_db, in_table in rows:
+        total, in_db = float(total), float(in_db)
+        if in_db > total:
+            failures.append(f"{name}: oversold, {in_db} reserved of {total}")
+        if in_db != reserved.get(name, 0):
+            failures.append(f"{name}: {in_db} reserved in the database, {reserved.get(name, 0)} acknowledged")
+        if in_table is None or float(in_table) != in_db:
+            failures.append(f"{name}: stock_availability says {in_table}, reservations sum to {in_db}")
+    if len(rows) != len(items):
+        failures.append(f"expected {len(items)} items, found {len(rows)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that parallel reservations never oversell")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent clients (default 16)")
+    parser.add_argument("--requests", type=int, default=50, help="requests per client (default 50)")
+    parser.add_argument("--items", type=int, default=20, help="items to seed (default 20)")
+    parser.add_argument("--hot", type=int, default=3, help="items most requests compete for (default 3)")
+    parser.add_argument("--stock", type=int, default=100, help="qty of every item (default 100)")
+    parser.add_argument("--max-lines", type=int, default=10, help="max lines per bulk request (default 10)")
+    parser.add_argument("--single-ratio", type=float, default=0.2,
+                        help="share of requests sent to the single-item endpoint (default 0.2)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+
+    if BENCH_MYSQL_DB == os.getenv("MYSQL_DB", "inventory_db"):
+        sys.exit(f"BENCH_MYSQL_DB ({BENCH_MYSQL_DB}) is the live database")
+    prepare_database(args.items, args.stock)
+
+    # before app is imported: its pool reads these
+    os.environ["MYSQL_DB"] = BENCH_MYSQL_DB
+    os.environ["MYSQL_POOL_SIZE"] = str(min(max(args.threads, 5), 32))
+    os.environ["EMAIL_NOTIFY"] = ""
+    os.environ.pop("RESERVATION_MAINTENANCE_THREAD", None)
+    from app import app
+
+    items = [f"{ITEM_PREFIX}{n:04d}" for n in range(args.items)]
+    results = {"status": {}, "reserved": {}, "errors": []}
+    lock = threading.Lock()
+    start = threading.Barrier(args.threads)
+    threads = [threading.Thread(target=worker, args=(app, n, args, items, results, lock, start))
+               for n in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = time.perf_counter() - t0
+
+    total = args.threads * args.requests
+    print(f"{total} requests in {seconds:.2f}s ({total / seconds:.1f} req/s), status counts {results['status']}")
+    for status, error in results["errors"][:10]:
+        print(f"  HTTP {status}: {error}")
+    if not results["status"].get(400):
+        print("warning: no request was rejected; raise --requests or lower --stock to exhaust the hot items")
+
+    failures = check(items, results["reserved"])
+    if results["errors"]:
+        failures.append(f"{len(results['errors'])} requests failed with a server error")
+    for f in failures:
+        print("FAIL", f)
+    print("OK: no oversell" if not failures else f"{len(failures)} checks failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,22 +14,60 @@ Usage:
 Test locally:
     curl http://127.0.0.1:5000/ledgers
     curl -H "X-API-KEY: some_long_secret" http://127.0.0.1:5000/stock_items
+    curl -H "X-API-KEY: some_long_secret" "http://127.0.0.1:5000/stock_movements?limit=5000"
+    curl -H "Accept: application/x-ndjson" http://127.0.0.1:5000/stock_movements
 """
 
 import os
+import gzip
+import json
+import base64
 import logging
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from contextlib import contextmanager
 from datetime import date, datetime
-from flask import Flask, jsonify, request, abort
-try:
-    import pyodbc
-except Exception as e:
-    raise RuntimeError("pyodbc is required on the Tally machine. Install it (pip install pyodbc) and ensure ODBC DSN is configured.") from e
+from decimal import Decimal
+from flask import Flask, Response, jsonify, request, abort
+# Replay a recorded or synthetic Tally (etl/tally_fixture.py) instead of ODBC,
+# e.g. to benchmark the gateway away from the Tally machine
+TALLY_FIXTURE = os.getenv("TALLY_FIXTURE", "")
+if TALLY_FIXTURE:
+    from etl import tally_fixture as pyodbc  # connect() / Error stand in for pyodbc's
+else:
+    try:
+        import pyodbc
+    except Exception as e:
+        raise RuntimeError("pyodbc is required on the Tally machine. Install it (pip install pyodbc) and ensure ODBC DSN is configured.") from e
 
 # Basic config
 DSN = os.getenv("TALLY_DSN", "TallyODBC64_9000")
 API_KEY = os.getenv("TALLY_API_KEY", "")  # set this to a long random string
 HOST = os.getenv("GATEWAY_HOST", "127.0.0.1")
 PORT = int(os.getenv("GATEWAY_PORT", 5000))
+GZIP_MIN_BYTES = int(os.getenv("GATEWAY_GZIP_MIN_BYTES", 1024))
+POOL_SIZE = int(os.getenv("GATEWAY_POOL_SIZE", 4))
+POOL_TIMEOUT = float(os.getenv("GATEWAY_POOL_TIMEOUT", 30))
+# idle connections older than this are pinged before reuse
+POOL_PING_AFTER = float(os.getenv("GATEWAY_POOL_PING_AFTER", 30))
+POOL_PING_QUERY = os.getenv("GATEWAY_POOL_PING_QUERY", "SELECT $Name FROM Company")
+# Tally's ODBC server copes badly with parallel queries; 1 fully serializes them
+MAX_CONCURRENT_QUERIES = int(os.getenv("GATEWAY_MAX_CONCURRENT_QUERIES", 1))
+# A query waiting longer than SLOT_TIMEOUT seconds for a slot, or arriving when
+# MAX_QUEUED are already waiting, is answered with 503 instead of piling up
+SLOT_TIMEOUT = float(os.getenv("GATEWAY_SLOT_TIMEOUT", 60))
+MAX_QUEUED = int(os.getenv("GATEWAY_MAX_QUEUED", 16))
+# Result cache: per-endpoint TTL in seconds (0 disables) and a total memory budget
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTLS = {
+    "companies": float(os.getenv("GATEWAY_CACHE_TTL_COMPANIES", 3600)),
+    "ledgers": float(os.getenv("GATEWAY_CACHE_TTL_LEDGERS", 600)),
+    "stock_items": float(os.getenv("GATEWAY_CACHE_TTL_STOCK_ITEMS", 300)),
+    "stock_movements": float(os.getenv("GATEWAY_CACHE_TTL_STOCK_MOVEMENTS", 0)),
+}
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
@@ -44,11 +82,317 @@ def _require_api_key():
             logging.warning("Unauthorized request from %s", request.remote_addr)
             abort(401)
 
+# Compress JSON bodies for clients that accept gzip (the office uplink is slow)
+@app.after_request
+def _gzip_response(resp):
+    if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+            or "Content-Encoding" in resp.headers
+            or "gzip" not in request.headers.get("Accept-Encoding", "").lower()):
+        return resp
+    body = resp.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return resp
+    resp.set_data(gzip.compress(body, compresslevel=5))
+    resp.headers["Content-Encoding"] = "gzip"
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
 def _connect():
-    """Open pyodbc connection to Tally via DSN."""
+    """Open pyodbc connection to Tally via DSN (or the replay fixture)."""
+    if TALLY_FIXTURE:
+        return pyodbc.connect(TALLY_FIXTURE)
     logging.debug("Connecting to Tally ODBC DSN=%s", DSN)
     return pyodbc.connect(f"DSN={DSN}")
 
+class OdbcPool:
+    """
+    Small pool of long-lived Tally ODBC connections.
+    - at most `max_size` connections are open; callers wait up to `timeout`
+    - idle connections are pinged before reuse and replaced if dead
+    - a connection that raised pyodbc.Error is discarded, so the pool
+      reconnects on its own after Tally restarts
+    """
+
+    def __init__(self, connect, max_size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 ping_after=POOL_PING_AFTER, ping_query=POOL_PING_QUERY):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.ping_query = ping_query
+        self._idle = []          # [(conn, last_used)]
+        self._open = 0
+        self._cond = threading.Condition()
+        self.reconnects = 0
+
+    def _alive(self, conn):
+        try:
+            cur = conn.cursor()
+            cur.execute(self.ping_query)
+            cur.fetchmany(1)
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for a Tally ODBC connection")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._open += 1
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+            if time.monotonic() - last_used < self.ping_after or self._alive(conn):
+                return conn
+            logging.warning("Dropping dead Tally ODBC connection")
+            self.reconnects += 1
+            self._discard(conn)
+
+    def release(self, conn, broken=False):
+        if broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except pyodbc.Error:
+            self.release(conn, broken=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            return {"open": self._open, "idle": len(self._idle), "max_size": self.max_size,
+                    "reconnects": self.reconnects}
+
+_pool = OdbcPool(_connect)
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Busy(Exception):
+    """No query slot became free in time (or the queue is full); answered with 503."""
+
+class OutOfOrder(Exception):
+    """Tally returned rows out of the order keyset cursors assume; answered with 500."""
+
+class QueryScheduler:
+    """
+    Front door for every Tally query.
+    - run(key, fn): identical in-flight queries (same key) are coalesced into a
+      single execution whose result is handed to every waiter
+    - at most `max_concurrent` queries execute at once; the rest queue, up to
+      `max_queued` of them for at most `timeout` seconds, else Busy is raised
+    - queue depth and wait times are kept for /stats
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_QUERIES, timeout=SLOT_TIMEOUT, max_queued=MAX_QUEUED):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.queued = 0
+        self.running = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rejected = 0
+
+    def acquire_slot(self):
+        t0 = time.monotonic()
+        with self._lock:
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise Busy(f"{self.queued} Tally queries already waiting")
+            self.queued += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.queued -= 1
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+            raise Busy(f"no Tally query slot free within {self.timeout:g}s")
+        waited = time.monotonic() - t0
+        with self._lock:
+            self.running += 1
+            self.executed += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def release_slot(self):
+        with self._lock:
+            self.running -= 1
+        self._slots.release()
+
+    def run(self, key, fn):
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            self.acquire_slot()
+            try:
+                flight.result = fn()
+            finally:
+                self.release_slot()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "queued": self.queued,
+                "running": self.running,
+                "in_flight": len(self._inflight),
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(1000 * self.total_wait / self.executed, 1) if self.executed else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 1),
+            }
+
+_scheduler = QueryScheduler()
+
+class ResultCache:
+    """
+    LRU cache of serialized JSON responses with a per-entry TTL and a total
+    byte budget. Each entry keeps the raw body and, for larger bodies, a gzip
+    copy, so a hit skips the ODBC read, row conversion, JSON encoding and
+    compression.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (expires_at, endpoint, body, gzipped)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(entry):
+        return len(entry[2]) + (len(entry[3]) if entry[3] else 0)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._size -= self._entry_size(entry)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, endpoint, body, ttl):
+        if ttl <= 0:
+            return
+        gzipped = gzip.compress(body, compresslevel=5) if len(body) >= GZIP_MIN_BYTES else None
+        entry = (time.monotonic() + ttl, endpoint, body, gzipped)
+        size = self._entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while self._entries and self._size + size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = entry
+            self._size += size
+
+    def invalidate(self, endpoint=None):
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if endpoint is None or e[1] == endpoint]
+            for k in keys:
+                self._drop(k)
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+_cache = ResultCache()
+
+def _json_bytes(payload):
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+def _cached_response(entry, status):
+    _, _, body, gzipped = entry
+    if gzipped is not None and "gzip" in request.headers.get("Accept-Encoding", "").lower():
+        resp = Response(gzipped, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
+        resp.headers["Vary"] = "Accept-Encoding"
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.headers["X-Cache"] = status
+    return resp
+
 def _to_iso(d):
     if isinstance(d, (datetime, date)):
         return d.isoformat()
@@ -82,122 +426,490 @@ def _row_to_dict(row, cols):
 def index():
     return jsonify({"ok": True, "service": "tally_gateway", "dsn": DSN})
 
-# Companies
-@app.route("/companies")
-def companies():
-    q = "SELECT $Name, $StartingFrom, $EndingAt FROM Company"
-    cols = ["name", "period_start", "period_end"]
+# ---------------------------
+# Pagination
+# ?limit=N[&cursor=...] returns {"data": [...], "next_cursor": ...} over a stable
+# ORDER BY. The cursor is an opaque keyset token: the ORDER BY values of the
+# last row returned (plus how many rows shared them), so the next page starts
+# right after that row even if rows were added or removed in between, and a
+# consumer can resume from the last cursor it saw after a dropped connection.
+# Master lists push the seek down to Tally ($Name >= last name); movements
+# skip up to the cursor as rows are read (see stock_movements).
+# ?offset=N is kept as an explicit opt-in for pipelining several page requests
+# at once (and for paging NDJSON streams, which have no next_cursor); it
+# re-reads and drops N rows per page. Rows arriving out of the order cursors
+# assume fail the request instead of being skipped.
+# Without limit/cursor/offset the endpoint returns the full list as before.
+# ---------------------------
+MAX_PAGE_SIZE = int(os.getenv("GATEWAY_MAX_PAGE_SIZE", 50000))
+FETCH_BATCH = int(os.getenv("GATEWAY_FETCH_BATCH", 2000))
+
+def _key_value(v):
+    """A raw ORDER BY value as it is kept in a cursor (JSON-safe)."""
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+def _sort_key(values):
+    # Tally sorts text case-insensitively; NULLs sort last
+    return tuple((v is None, v.casefold() if isinstance(v, str) else v) for v in values)
+
+def _encode_cursor(key, ties):
+    raw = json.dumps({"k": list(key), "n": ties}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(token):
+    """Return ("after", (key, ties)) for a keyset cursor, ("offset", n) for an old offset cursor."""
+    padded = token + "=" * (-len(token) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    if "o" in data:
+        if not isinstance(data["o"], int) or data["o"] < 0:
+            raise ValueError("bad cursor")
+        return "offset", data["o"]
+    key, ties = data["k"], data["n"]
+    if not isinstance(key, list) or not isinstance(ties, int) or ties < 1:
+        raise ValueError("bad cursor")
+    return "after", (tuple(key), ties)
+
+def _page_args():
+    """
+    Return (limit, offset, after) for a paginated request, None for a full one;
+    `after` is the (key, ties) of a keyset cursor. Raises ValueError.
+    """
+    limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
+    offset = request.args.get("offset")
+    if limit is None and cursor is None and offset is None:
+        return None
+    limit = int(limit) if limit else MAX_PAGE_SIZE
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    limit = min(limit, MAX_PAGE_SIZE)
+    if cursor:
+        kind, value = _decode_cursor(cursor)
+        return (limit, 0, value) if kind == "after" else (limit, value, None)
+    offset = int(offset) if offset else 0
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    return limit, offset, None
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _fetch(cur):
+    while True:
+        batch = cur.fetchmany(FETCH_BATCH)
+        if not batch:
+            return
+        yield from batch
+
+def _rows(cur, convert, keep=None):
+    """Yield converted rows from fetchmany batches, dropping those `keep` rejects."""
+    for r in _fetch(cur):
+        row = convert(r)
+        if keep is None or keep(row):
+            yield row
+
+def _ordered_rows(cur, convert, key, keep=None, after=None):
+    """
+    Yield (row, position) for the converted rows `keep` accepts, in ORDER BY
+    order and starting right after the keyset cursor `after`. `key` gives the
+    ORDER BY values of a raw row; `position` is the (key, ties) cursor just
+    past the row, counting every row read (kept or not) that shares its key.
+    """
+    prev, ties = None, 0
+    if after is not None:
+        seek, skip = _sort_key(after[0]), after[1]
+    for r in _fetch(cur):
+        values = tuple(_key_value(v) for v in key(r))
+        k = _sort_key(values)
+        # seeking relies on _sort_key agreeing with Tally's ORDER BY; fail
+        # loudly rather than silently drop rows at page boundaries
+        if prev is not None and k < prev:
+            raise OutOfOrder(f"Tally returned {list(values)} after {list(prev_values)}, "
+                             "out of the order cursors assume")
+        ties = ties + 1 if k == prev else 1
+        prev, prev_values = k, values
+        if after is not None:
+            if k < seek:
+                continue
+            if k == seek and skip:
+                skip -= 1
+                continue
+            after = None
+        row = convert(r)
+        if keep is None or keep(row):
+            yield row, (values, ties)
+
+def _query_all(q, convert, keep=None):
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(q)
+        data = list(_rows(cur, convert, keep))
+        cur.close()
+    return data
+
+def _query_page(q, convert, key, page, keep=None):
+    """Run q and return (rows, cursor of the next page or None) for one page, reading in fetchmany batches."""
+    limit, offset, after = page
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute(q)
+        rows = islice(_ordered_rows(cur, convert, key, keep, after), offset, None)
+        data, position = [], None
+        for row, position in islice(rows, limit):
+            data.append(row)
+        more = next(rows, None) is not None
+        cur.close()
+    return data, (_encode_cursor(*position) if more else None)
+
+# ---------------------------
+# NDJSON streaming
+# Accept: application/x-ndjson (or ?format=ndjson) streams one JSON object per
+# line, so memory stays flat and the consumer can start loading before the
+# query is finished. A background thread drains the ODBC cursor into a spool
+# file at Tally's pace and then gives back the connection and scheduler slot;
+# the response reads behind it, so a slow client never holds up other
+# queries. Paging parameters still apply; a page shorter than `limit` means
+# the end was reached.
+# ---------------------------
+NDJSON_MIMETYPE = "application/x-ndjson"
+SPOOL_READ_SIZE = 64 * 1024
+
+class _Spool:
+    """Temp file written by one producer thread and read, as it grows, by one response."""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="gateway_", suffix=".ndjson")
+        self._w = os.fdopen(fd, "wb")
+        self._cond = threading.Condition()
+        self.size = 0
+        self.done = False
+        self.error = None
+        self._reader_closed = False
+
+    def write(self, data):
+        self._w.write(data)
+        self._w.flush()
+        with self._cond:
+            self.size += len(data)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        self._w.close()
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+            remove = self._reader_closed
+        if remove:
+            self._remove()
+
+    @property
+    def reader_closed(self):
+        with self._cond:
+            return self._reader_closed
+
+    def close_reader(self):
+        with self._cond:
+            if self._reader_closed:
+                return
+            self._reader_closed = True
+            remove = self.done
+        if remove:
+            self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            logging.warning("Could not remove spool file %s", self.path)
+
+    def chunks(self):
+        pos = 0
+        with open(self.path, "rb") as r:
+            while True:
+                with self._cond:
+                    while self.size == pos and not self.done:
+                        self._cond.wait()
+                    size, error = self.size, self.error
+                if size > pos:
+                    data = r.read(min(size - pos, SPOOL_READ_SIZE))
+                    pos += len(data)
+                    yield data
+                    continue
+                if error is not None:
+                    raise error
+                return
+
+def _wants_ndjson():
+    if request.args.get("format", "").lower() == "ndjson":
+        return True
+    return NDJSON_MIMETYPE in request.headers.get("Accept", "")
+
+def _stream_ndjson(name, q, convert, key=None, page=None, keep=None):
+    # streams cannot be shared between requests, but they still hold a
+    # scheduler slot for as long as they read from Tally (not while the client
+    # downloads)
+    _scheduler.acquire_slot()
+    # connect and execute up front so failures still produce a proper 500
+    try:
+        conn = _pool.acquire()
+    except Exception:
+        _scheduler.release_slot()
+        raise
     try:
-        conn = _connect()
         cur = conn.cursor()
-        rows = cur.execute(q).fetchall()
-        data = []
-        for r in rows:
-            data.append({
-                "name": str(r[0]).strip() if r[0] is not None else None,
-                "period_start": _to_iso(r[1]),
-                "period_end": _to_iso(r[2])
-            })
-        conn.close()
-        return jsonify(data)
+        cur.execute(q)
+    except Exception as e:
+        _pool.release(conn, broken=isinstance(e, pyodbc.Error))
+        _scheduler.release_slot()
+        raise
+
+    spool = _Spool()
+
+    def produce():
+        broken, error = False, None
+        try:
+            if page is None:
+                rows = _rows(cur, convert, keep)
+            else:
+                limit, offset, after = page
+                rows = _ordered_rows(cur, convert, key, keep, after)
+                rows = (row for row, _ in islice(rows, offset, offset + limit))
+            while True:
+                # the client went away: stop scanning and give Tally its slot back
+                if spool.reader_closed:
+                    logging.info("%s stream stopped early: client disconnected", name)
+                    break
+                batch = list(islice(rows, FETCH_BATCH))
+                if not batch:
+                    break
+                spool.write("".join(json.dumps(row, separators=(",", ":")) + "\n" for row in batch).encode("utf-8"))
+        except Exception as e:
+            broken, error = isinstance(e, pyodbc.Error), e
+            logging.exception("%s stream aborted", name)
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                broken = True
+            _pool.release(conn, broken=broken)
+            _scheduler.release_slot()
+            spool.finish(error)
+
+    threading.Thread(target=produce, name=f"ndjson-{name}", daemon=True).start()
+
+    def generate():
+        try:
+            yield from spool.chunks()
+        finally:
+            spool.close_reader()
+
+    resp = Response(generate(), mimetype=NDJSON_MIMETYPE)
+    # the body may never be iterated (e.g. HEAD or an early disconnect)
+    resp.call_on_close(spool.close_reader)
+    return resp
+
+def _respond(name, q, order_by, convert, key, keep=None, key_extra=(), seek_column=None):
+    """
+    Serve one query as JSON (cached, coalesced), a JSON page, or an NDJSON stream.
+    `key` returns the ORDER BY values of a raw row for keyset cursors; with
+    `seek_column` (the single ORDER BY column) the seek is pushed down to Tally.
+    `keep` filters converted rows; `key_extra` must identify that filter.
+    """
+    try:
+        page = _page_args()
+    except Exception:
+        return jsonify({"error": "invalid limit/cursor/offset"}), 400
+    if page is not None:
+        after = page[2]
+        if seek_column and after is not None and isinstance(after[0][0], str):
+            q = f"{q} WHERE {seek_column} >= {_sql_literal(after[0][0])}"
+        q = f"{q} ORDER BY {order_by}"
+    try:
+        if _wants_ndjson():
+            if page is not None and page[2] is not None:
+                # a stream has nowhere to return next_cursor
+                return jsonify({"error": "cursor is not supported with NDJSON; page streams with limit/offset"}), 400
+            return _stream_ndjson(name, q, convert, key, page, keep)
+        cache_key = (name,) + tuple(key_extra) + (page or ())
+        entry = _cache.get(cache_key)
+        if entry is not None:
+            return _cached_response(entry, "HIT")
+
+        if page is None:
+            def run():
+                return _json_bytes(_query_all(q, convert, keep))
+        else:
+            def run():
+                data, next_cursor = _query_page(q, convert, key, page, keep)
+                body = {"data": data, "limit": page[0], "next_cursor": next_cursor}
+                if page[2] is None:
+                    body["offset"] = page[1]
+                return _json_bytes(body)
+        body = _scheduler.run(cache_key, run)
+        _cache.put(cache_key, name, body, CACHE_TTLS.get(name, 0))
+        return _cached_response((None, name, body, None), "MISS")
+    except Busy as e:
+        logging.warning("%s rejected: %s", name, e)
+        resp = jsonify({"error": f"Tally is busy: {e}"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "5"
+        return resp
     except Exception as e:
-        logging.exception("companies query failed")
+        logging.exception("%s query failed", name)
         return jsonify({"error": str(e)}), 500
 
+# Masters are paged by $Name, their first column
+def _name_key(r):
+    return (r[0],)
+
+# Companies
+COMPANIES_QUERY = "SELECT $Name, $StartingFrom, $EndingAt FROM Company"
+
+def _company_row(r):
+    return {
+        "name": str(r[0]).strip() if r[0] is not None else None,
+        "period_start": _to_iso(r[1]),
+        "period_end": _to_iso(r[2])
+    }
+
+@app.route("/companies")
+def companies():
+    return _respond("companies", COMPANIES_QUERY, "$Name", _company_row, _name_key, seek_column="$Name")
+
 # Ledgers
+LEDGERS_QUERY = "SELECT $Name, $Parent FROM Ledger"
+
+def _ledger_row(r):
+    return {"name": str(r[0]).strip() if r[0] else None,
+            "parent": str(r[1]).strip() if r[1] else None}
+
 @app.route("/ledgers")
 def ledgers():
-    q = "SELECT $Name, $Parent FROM Ledger"
-    try:
-        conn = _connect()
-        cur = conn.cursor()
-        rows = cur.execute(q).fetchall()
-        data = [{"name": str(r[0]).strip() if r[0] else None,
-                 "parent": str(r[1]).strip() if r[1] else None} for r in rows]
-        conn.close()
-        return jsonify(data)
-    except Exception as e:
-        logging.exception("ledgers query failed")
-        return jsonify({"error": str(e)}), 500
+    return _respond("ledgers", LEDGERS_QUERY, "$Name", _ledger_row, _name_key, seek_column="$Name")
 
 # Stock items — match pipeline's expected fields:
 # name, category, base_unit, opening_qty, opening_rate (closing used here)
+STOCK_ITEMS_QUERY = """
+    SELECT $Name, $Parent, $BaseUnits, $_ClosingBalance, $_ClosingRate
+    FROM StockItem
+"""
+
+def _stock_item_row(r):
+    return {
+        "name": str(r[0]).strip() if r[0] is not None else None,
+        "category": str(r[1]).strip() if r[1] is not None else None,
+        "base_unit": str(r[2]).strip() if r[2] is not None else None,
+        "closing_qty": _safe_float(r[3]),
+        "closing_rate": _safe_float(r[4])
+    }
+
 @app.route("/stock_items")
 def stock_items():
-    q = """
-        SELECT $Name, $Parent, $BaseUnits, $_ClosingBalance, $_ClosingRate
-        FROM StockItem
-    """
-    try:
-        conn = _connect()
-        cur = conn.cursor()
-        rows = cur.execute(q).fetchall()
-        data = []
-        for r in rows:
-            name = str(r[0]).strip() if r[0] is not None else None
-            category = str(r[1]).strip() if r[1] is not None else None
-            base_unit = str(r[2]).strip() if r[2] is not None else None
-            closing_qty = _safe_float(r[3])
-            closing_rate = _safe_float(r[4])
-            data.append({
-                "name": name,
-                "category": category,
-                "base_unit": base_unit,
-                "closing_qty": closing_qty,
-                "closing_rate": closing_rate
-            })
-        conn.close()
-        return jsonify(data)
-    except Exception as e:
-        logging.exception("stock_items query failed")
-        return jsonify({"error": str(e)}), 500
+    return _respond("stock_items", STOCK_ITEMS_QUERY, "$Name", _stock_item_row, _name_key, seek_column="$Name")
 
 # Stock movements (voucher-level) — match pipeline's VchStockItem fields
+# Delta pulls: ?since=YYYY-MM-DD returns movements dated on/after that day;
+# ?since_alter_id=N also selects $AlterID and returns rows altered after N.
+# Tally's ODBC layer has no dependable predicate support on VchStockItem, so
+# the filter is applied as rows are read; only matching rows are converted
+# and sent over the uplink.
+STOCK_MOVEMENTS_QUERY = """
+    SELECT $_LastSaleDate, $PriceLevel, $StockItemName, $_LastSalePrice, $_OutwardQuantity, $_OutwardValue
+    FROM VchStockItem
+"""
+STOCK_MOVEMENTS_ALTER_QUERY = """
+    SELECT $_LastSaleDate, $PriceLevel, $StockItemName, $_LastSalePrice, $_OutwardQuantity, $_OutwardValue, $AlterID
+    FROM VchStockItem
+"""
+STOCK_MOVEMENTS_ORDER = "$_LastSaleDate, $StockItemName, $PriceLevel, $_OutwardQuantity, $_OutwardValue, $_LastSalePrice"
+
+def _movement_key(r):
+    # STOCK_MOVEMENTS_ORDER, by column position in the movement queries
+    return (r[0], r[2], r[1], r[4], r[5], r[3])
+
+def _movement_alter_key(r):
+    return (r[6],)
+
+def _movement_row(r):
+    # columns: date, party, item_name, rate, qty, amount
+    amount = _safe_float(r[5])
+    return {
+        "date": _to_iso(r[0]) if r[0] is not None else None,
+        "voucher_no": None,
+        "company": str(r[1]).strip() if r[1] is not None else None,  # pipeline maps 'party' -> company/brand
+        "item": str(r[2]).strip() if r[2] is not None else None,
+        "qty": _safe_float(r[4]),
+        "rate": _safe_float(r[3]),
+        "amount": amount,
+        "movement_type": "OUT" if amount > 0 else "IN"
+    }
+
+def _movement_row_with_alter_id(r):
+    row = _movement_row(r)
+    row["alter_id"] = int(_safe_float(r[6]))
+    return row
+
 @app.route("/stock_movements")
 def stock_movements():
-    q = """
-        SELECT $_LastSaleDate, $PriceLevel, $StockItemName, $_LastSalePrice, $_OutwardQuantity, $_OutwardValue
-        FROM VchStockItem
-    """
+    since = request.args.get("since", "").strip()
+    since_alter_id = request.args.get("since_alter_id", "").strip()
     try:
-        conn = _connect()
-        cur = conn.cursor()
-        rows = cur.execute(q).fetchall()
-        data = []
-        for r in rows:
-            # columns: date, party, item_name, rate, qty, amount
-            date_val = _to_iso(r[0]) if r[0] is not None else None
-            party = str(r[1]).strip() if r[1] is not None else None
-            item_name = str(r[2]).strip() if r[2] is not None else None
-            rate = _safe_float(r[3])
-            qty = _safe_float(r[4])
-            amount = _safe_float(r[5])
-            movement_type = "OUT" if amount > 0 else "IN"
-            data.append({
-                "date": date_val,
-                "voucher_no": None,
-                "company": party,          # pipeline maps 'party' -> company/brand
-                "item": item_name,
-                "qty": qty,
-                "rate": rate,
-                "amount": amount,
-                "movement_type": movement_type
-            })
-        conn.close()
-        return jsonify(data)
-    except Exception as e:
-        logging.exception("stock_movements query failed")
-        return jsonify({"error": str(e)}), 500
+        since = date.fromisoformat(since).isoformat() if since else None
+        since_alter_id = int(since_alter_id) if since_alter_id else None
+    except ValueError:
+        return jsonify({"error": "since must be YYYY-MM-DD and since_alter_id an integer"}), 400
+
+    if since is None and since_alter_id is None:
+        return _respond("stock_movements", STOCK_MOVEMENTS_QUERY, STOCK_MOVEMENTS_ORDER, _movement_row, _movement_key)
+
+    def keep(m):
+        if since is not None and (m["date"] or "")[:10] < since:
+            return False
+        if since_alter_id is not None and m["alter_id"] <= since_alter_id:
+            return False
+        return True
+
+    if since_alter_id is None:
+        q, convert, order_by, key = STOCK_MOVEMENTS_QUERY, _movement_row, STOCK_MOVEMENTS_ORDER, _movement_key
+    else:
+        q, convert, order_by, key = (STOCK_MOVEMENTS_ALTER_QUERY, _movement_row_with_alter_id,
+                                     "$AlterID", _movement_alter_key)
+    return _respond("stock_movements", q, order_by, convert, key, keep=keep, key_extra=(since, since_alter_id))
 
 # Simple health endpoint
 @app.route("/health")
 def health():
     try:
-        conn = _connect()
-        conn.close()
-        return jsonify({"ok": True})
+        # a pooled checkout also runs the liveness check on stale connections
+        with _pool.connection():
+            pass
+        return jsonify({"ok": True, "pool": _pool.stats(), "scheduler": _scheduler.stats()})
     except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 500
+        return jsonify({"ok": False, "error": str(e), "pool": _pool.stats(), "scheduler": _scheduler.stats()}), 500
+
+# Query queue / pool / cache metrics
+@app.route("/stats")
+def stats():
+    return jsonify({"pool": _pool.stats(), "scheduler": _scheduler.stats(), "cache": _cache.stats()})
+
+# Drop cached results, e.g. right after masters were edited in Tally:
+#   curl -X POST -H "X-API-KEY: ..." "http://127.0.0.1:5000/cache/invalidate?endpoint=stock_items"
+@app.route("/cache/invalidate", methods=["POST"])
+def cache_invalidate():
+    # before_request already checked the key; refuse outright when no key is configured
+    if not API_KEY:
+        return jsonify({"ok": False, "error": "TALLY_API_KEY must be set to use cache invalidation"}), 403
+    endpoint = request.args.get("endpoint") or (request.get_json(silent=True) or {}).get("endpoint")
+    if endpoint and endpoint not in CACHE_TTLS:
+        return jsonify({"ok": False, "error": f"unknown endpoint {endpoint}"}), 400
+    dropped = _cache.invalidate(endpoint)
+    logging.info("Cache invalidated (%s): %d entries", endpoint or "all", dropped)
+    return jsonify({"ok": True, "invalidated": dropped})
 
 if __name__ == "__main__":
     logging.info("Starting Tally Gateway (DSN=%s) on %s:%d", DSN, HOST, PORT)